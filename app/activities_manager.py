@@ -1,12 +1,19 @@
 """Module used to manage the Activities Manager"""
 
 import logging
+from datetime import datetime
+from typing import Callable, Iterable, Iterator, Optional
 
+import numpy as np
 from celery.app.task import Task
 
-from .assets import Activity, User
+from . import geometry, heatmap, hexbin, polyline, simplify
+from .assets import Activity, ActivityBatch, User
+from .confs import Conf
 from .postgres import Postgres
 from .strava import Strava
+from .sync_checkpoint import SyncCheckpoint
+from .tile_cache import TileCache, hash_email
 
 logger = logging.getLogger(__name__)
 
@@ -14,51 +21,492 @@ logger = logging.getLogger(__name__)
 class ActivitiesManager:
     """Activities Manager class to create and retrieve the activities"""
 
-    def __init__(self, postgres: Postgres, strava: Strava):
+    def __init__(
+        self,
+        conf: Conf,
+        postgres: Postgres,
+        strava: Strava,
+        sync_checkpoint: SyncCheckpoint,
+    ):
+        self.conf = conf
         self.postgres = postgres
         self.strava = strava
+        self.heatmap_cache = TileCache(self.conf, "heatmap")
+        self.height_map_cache = TileCache(self.conf, "height_maps")
+        self.sync_checkpoint = sync_checkpoint
 
-    def get_activities(self, user: User) -> list[Activity]:
-        """Returns the activities of the given user"""
-        return [
-            Activity(activity_details)
-            for activity_details in self.postgres.get_activities_details(user)
+    def iter_activities(
+        self,
+        user: User,
+        columns: tuple = Activity.SCHEMA,
+        bbox: Optional[tuple[float, float, float, float]] = None,
+    ) -> Iterator[Activity]:
+        """Streams the activities of the given user, only loading the given columns,
+        in constant memory whatever the size of the history of the user.\n
+        If the track is not selected, it is loaded on demand for each activity.\n
+        If a (min_latitude, min_longitude, max_latitude, max_longitude) bbox is given,
+        only the activities intersecting it are returned"""
+        track_loader = None if "track" in columns else self.postgres.get_activity_track
+        for row in self.postgres.iter_activities_rows(user, columns, bbox):
+            yield Activity.from_row(row, columns, track_loader)
+
+    def get_activity_batch(
+        self,
+        user: User,
+        bbox: Optional[tuple[float, float, float, float]] = None,
+    ) -> ActivityBatch:
+        """Returns the activities of the user as NumPy columns,
+        only the ones intersecting the bbox if given"""
+        return ActivityBatch.from_rows(
+            self.postgres.iter_activities_rows(user, ActivityBatch.SCHEMA, bbox)
+        )
+
+    def _locate_activities(self, activities: list[Activity]):
+        """Computes the bounding box and the start point of the activities
+        from their tracks, left to None for the activities without track"""
+        coords, offsets = polyline.decode_batch(
+            activity.track for activity in activities
+        )
+        for activity, first, last in zip(activities, offsets[:-1], offsets[1:]):
+            if first == last:
+                continue
+            points = coords[first:last]
+            (min_lat, min_lng), (max_lat, max_lng) = points.min(0), points.max(0)
+            activity.bbox = f"(({min_lng}, {min_lat}), ({max_lng}, {max_lat}))"
+            activity.start_point = f"({points[0, 1]}, {points[0, 0]})"
+
+    def get_activities_stats(self, user: User) -> dict:
+        """Returns the number of activities, the latest start date
+        and the totals of each sport of the given user"""
+        sports = self.postgres.get_activities_stats(user)
+        return {
+            "count": sum(sport["count"] for sport in sports),
+            "latest_start_date": max(
+                (sport["latest_start_date"] for sport in sports), default=None
+            ),
+            "sports": sports,
+        }
+
+    def get_hexbins(
+        self,
+        user: User,
+        resolution: int,
+        bbox: Optional[tuple[float, float, float, float]] = None,
+    ) -> dict[str, np.ndarray]:
+        """Returns the hexagons crossed by the tracks of the given user at the given
+        resolution, bbox is (min_latitude, min_longitude, max_latitude, max_longitude).\n
+        The stored resolutions are read from the table `hexbins`,
+        the others are binned from the tracks"""
+        size = hexbin.get_hex_size(self.conf.HEXBIN["base_size"], resolution)
+        if resolution in self.conf.HEXBIN["stored_resolutions"]:
+            hexbins = hexbin.rows_to_hexbins(
+                self.postgres.get_hexbins(user, resolution)
+            )
+            return hexbin.crop_hexbins(hexbins, size, bbox) if bbox else hexbins
+
+        coords, offsets = polyline.decode_batch(
+            activity.track for activity in self.iter_activities(user, ("track",), bbox)
+        )
+        return hexbin.bin_tracks(coords, offsets, size, bbox)
+
+    def _update_hexbins(
+        self,
+        user: User,
+        tracks: Iterable[Optional[str]],
+        sign: int = 1,
+        clear: bool = False,
+    ):
+        """Adds the tracks to the stored hexagons of the user, or removes them if sign
+        is -1. If clear is True, the stored hexagons are replaced.\n
+        Until the hexagons of the user are built by _rebuild_hexbins, the tracks
+        are skipped, the activities imported before not being counted in them"""
+        if not clear and (not tracks or not user.hexbins_built):
+            return
+
+        coords, offsets = polyline.decode_batch(tracks)
+        rows = []
+        for resolution in self.conf.HEXBIN["stored_resolutions"]:
+            hexbins = hexbin.bin_tracks(
+                coords,
+                offsets,
+                hexbin.get_hex_size(self.conf.HEXBIN["base_size"], resolution),
+            )
+            rows.extend(
+                zip(
+                    [resolution] * len(hexbins["q"]),
+                    hexbins["q"].tolist(),
+                    hexbins["r"].tolist(),
+                    (sign * hexbins["counts"]).tolist(),
+                    (sign * hexbins["visits"]).tolist(),
+                )
+            )
+        self.postgres.update_hexbins(user, rows, clear)
+
+    def _rebuild_hexbins(self, user: User):
+        """Recomputes the stored hexagons of the user from all the tracks,
+        then marks them as built so that the next activities update them"""
+        self._update_hexbins(
+            user,
+            (activity.track for activity in self.iter_activities(user, ("track",))),
+            clear=True,
+        )
+        user.hexbins_built = True
+        self.postgres.update_user_details(user, {"hexbins_built": True})
+
+    def get_tracks(
+        self,
+        user: User,
+        zoom: float,
+        bbox: Optional[tuple[float, float, float, float]] = None,
+    ) -> dict[str, Optional[str]]:
+        """Returns the tracks of the user intersecting the bbox if given,
+        simplified to the level of detail matching the zoom of the map"""
+        level = simplify.get_level(zoom, self.conf.TRACKS["tolerances"])
+        if level is None:
+            return {
+                activity.id: activity.track
+                for activity in self.iter_activities(user, ("id", "track"), bbox)
+            }
+        return self.postgres.get_tracks(user, level, bbox)
+
+    def get_geometry(self, user: User, zoom: Optional[float] = None) -> dict:
+        """Returns the tracks of the user encoded by geometry.encode_geometry,
+        simplified according to the zoom if given, with:
+        - geometry : the binary columns
+        - sports : the names of the sports indexed by the sports column
+        - activities, points : the number of activities and points"""
+        tracks = (
+            self.get_tracks(user, zoom)
+            if zoom is not None
+            else {
+                activity.id: activity.track
+                for activity in self.iter_activities(user, ("id", "track"))
+            }
+        )
+        # The metadata are loaded as columns, the tracks following their order
+        batch = self.get_activity_batch(user)
+        tracks = [tracks.get(activity_id) for activity_id in batch.id]
+
+        coords, offsets = polyline.decode_batch(tracks)
+        sports_names, sports_index = np.unique(
+            [sport or "" for sport in batch.sport], return_inverse=True
+        )
+        return {
+            "geometry": geometry.encode_geometry(
+                coords, offsets, batch.start_date, sports_index
+            ),
+            "sports": sports_names.tolist(),
+            "activities": len(tracks),
+            "points": len(coords),
+        }
+
+    def _simplify_tracks(self, tracks: dict[str, Optional[str]]):
+        """Simplifies the {id: track} tracks at every level of detail and stores them"""
+        if tracks:
+            self.postgres.save_tracks(
+                [
+                    (activity_id, level, simplified_track)
+                    for activity_id, track in tracks.items()
+                    for level, simplified_track in enumerate(
+                        simplify.simplify(track, self.conf.TRACKS["tolerances"])
+                    )
+                ]
+            )
+
+    def get_heatmap_tile(self, user: User, z: int, x: int, y: int) -> bytes:
+        """Returns the PNG heatmap tile of the activities of the user,
+        rendered from the tracks crossing it or read from the cache"""
+        if tile := self.heatmap_cache.get(user, (z, x, y)):
+            return tile
+
+        coords, offsets = polyline.decode_batch(
+            self.get_tracks(user, z, heatmap.get_tile_bbox(z, x, y)).values()
+        )
+        size = self.conf.TILES["size"]
+        visits = heatmap.rasterize(
+            heatmap.to_pixels(coords, z, x, y, size), offsets, size
+        )
+        tile = heatmap.encode_png(heatmap.colorize(visits))
+        self.heatmap_cache.put(user, (z, x, y), tile)
+        return tile
+
+    def get_height_map(self, user: User, resolution: int, q: int, r: int) -> bytes:
+        """Returns the PNG grayscale height map of the roof of the hexagon (q, r),
+        following the visits of the tracks crossing it, or read from the cache"""
+        if height_map := self.height_map_cache.get(user, (resolution, q, r)):
+            return height_map
+
+        hex_size = hexbin.get_hex_size(self.conf.HEXBIN["base_size"], resolution)
+        size = self.conf.HEIGHT_MAPS["size"]
+        center = hexbin.hexes_to_points(np.array([q]), np.array([r]), hex_size)[0]
+        corners = hexbin.unproject(np.array([center - hex_size, center + hex_size]))
+        # The tracks are simplified under the size of a pixel of the texture
+        zoom = np.log2(simplify.METERS_PER_PIXEL * size / (2 * hex_size))
+
+        coords, offsets = polyline.decode_batch(
+            self.get_tracks(user, zoom, (*corners[0], *corners[1])).values()
+        )
+        visits = heatmap.rasterize(
+            heatmap.hex_to_pixels(coords, center, hex_size, size), offsets, size
+        )
+        height_map = heatmap.encode_png(
+            heatmap.to_heights(visits, self.conf.HEIGHT_MAPS["max_visits"])
+        )
+        self.height_map_cache.put(user, (resolution, q, r), height_map)
+        return height_map
+
+    def get_data_etag(self, user: User) -> str:
+        """Returns the ETag of the tiles and the geometry of the user, changed by
+        increment_data_version and different between the users of a same browser"""
+        return f"{hash_email(user.email)}-{user.data_version}"
+
+    def increment_data_version(self, user: User):
+        """Increments the version of the activities of the user
+        and drops the tiles rendered from the previous ones"""
+        user.data_version = self.postgres.increment_data_version(user)
+        self.heatmap_cache.invalidate(user.email)
+        self.height_map_cache.invalidate(user.email)
+
+    def save_activities(self, user: User, activities: list[Activity]):
+        """Saves the activities, then adds the inserted ones to the stored hexagons,
+        stores their simplified tracks and invalidates the rendered tiles"""
+        self._locate_activities(activities)
+        inserted_ids = set(self.postgres.save_activities(activities))
+        inserted = [
+            activity for activity in activities if str(activity.id) in inserted_ids
         ]
+        self._update_hexbins(user, [activity.track for activity in inserted])
+        self._simplify_tracks(
+            {str(activity.id): activity.track for activity in inserted}
+        )
+        if inserted:
+            self.increment_data_version(user)
+
+    def delete_activities(self, user: User, ids: list[str]):
+        """Deletes the activities, removes them from the stored hexagons
+        and invalidates the rendered tiles"""
+        tracks = self.postgres.get_activities_tracks(user, ids)
+        self.postgres.delete_activities(user, ids)
+        self._update_hexbins(user, list(tracks.values()), sign=-1)
+        self.increment_data_version(user)
+
+    def apply_activity_event(
+        self, user: User, activity_id: str, aspect_type: str, updates: dict
+    ):
+        """Applies a Strava webhook event on a single activity,
+        aspect_type being create, update or delete.\n
+        Raises RateLimitReached if the API quota is reached,
+        or requests.HTTPError if the activity can't be fetched"""
+        # An activity made private is no longer readable, it is deleted as well
+        if aspect_type == "delete" or updates.get("private") == "true":
+            logger.info(f"Deleting activity {activity_id} of {user.email}")
+            self.delete_activities(user, [activity_id])
+            return
+
+        if not (activity_details := self.strava.get_activity(user, activity_id)):
+            logger.warning(f"Activity {activity_id} of {user.email} not found")
+            return
+
+        logger.info(f"Importing activity {activity_id} of {user.email}")
+        # Existing activities are skipped by the insertion, updates replace them
+        if aspect_type == "update":
+            self.delete_activities(user, [activity_id])
+        self.save_activities(user, [Activity(activity_details)])
+
+    def _is_full_sync_needed(self, user: User) -> bool:
+        """Checks if the user has not been fully synchronized for too long"""
+        return (
+            user.last_full_sync is None
+            or user.last_full_sync + self.conf.SYNC["full_sync_interval"]
+            < datetime.now()
+        )
+
+    def get_sync_after(self, user: User) -> Optional[datetime]:
+        """Returns the date to list the new activities from,
+        or None if a full synchronization is needed"""
+        latest_start_date = self.postgres.get_sync_cursor(user)["latest_start_date"]
+        if self._is_full_sync_needed(user) or latest_start_date is None:
+            return None
+        return latest_start_date - self.conf.SYNC["cursor_margin"]
+
+    def is_synchronizing(self, user: User) -> bool:
+        """Checks if a worker holds the synchronization of the user, having made
+        progress on it recently or waiting to retry it"""
+        return self.sync_checkpoint.is_held(user.email)
+
+    def start_synchronization(self, user: User) -> Optional[datetime]:
+        """Returns the listing date of the synchronization of the user,
+        the one of the interrupted synchronization if any so it resumes from its
+        checkpoint, else the one of get_sync_after for a new checkpoint"""
+        if checkpoint := self.sync_checkpoint.get(user.email):
+            logger.info(
+                f"Resuming the synchronization of {user.email} "
+                + f"after {checkpoint['after']}"
+            )
+            self.sync_checkpoint.hold(user.email)
+            return checkpoint["after"]
+
+        after = self.get_sync_after(user)
+        self.sync_checkpoint.start(user.email, after)
+        return after
+
+    def list_synchronization(
+        self, user: User, task: Task, after: Optional[datetime] = None
+    ) -> dict:
+        """Lists the activities started after the given date to import.\n
+        If no date is given, every activity is listed to delete the non-existing ones.\n
+        Returns the plan of the synchronization given to finish_synchronization:
+        - to_import, to_delete : the ids of the activities
+        - full_sync : whether every activity has been listed
+        - sync_start : the timestamp of the listing
+        - count : the number of activities before the synchronization
+        - new_activities : the number of activities to import\n
+        The listing is checkpointed page by page, then the plan once listed,
+        a resumed synchronization only importing the activities not completed yet"""
+        checkpoint = self.sync_checkpoint.get(user.email) or {
+            "page": 1,
+            "listed_ids": [],
+            "plan": None,
+        }
+        if plan := checkpoint["plan"]:
+            completed_ids = checkpoint["completed_ids"]
+            logger.info(
+                f"Plan of {user.email} found : {len(completed_ids)}/"
+                + f"{plan['new_activities']} activity⸱ies already imported"
+            )
+            return plan | {
+                "to_import": [
+                    activity_id
+                    for activity_id in plan["to_import"]
+                    if activity_id not in completed_ids
+                ]
+            }
 
-    def synchronize_activities(self, user: User, task: Task) -> dict:
-        """Imports the new activities, deletes the non-existing ones"""
         task.update_state(
             state="PROGRESS", meta={"status": "Retrieving the list of activities"}
         )
-        imported_ids = [activity.id for activity in self.get_activities(user)]
-        available_ids = self.strava.get_activities_ids(user)
-        if to_import := list(set(available_ids) - set(imported_ids)):
+        cursor = self.postgres.get_sync_cursor(user)
+        full_sync = after is None
+        sync_start = datetime.now()
+
+        imported_ids = self.postgres.get_activities_ids(user, after)
+        available_ids = checkpoint["listed_ids"]
+        if checkpoint["page"] > 1:
             logger.info(
-                f"{len(imported_ids)} activity⸱ies in database &"
-                + f"{len(available_ids)} activity⸱ies on API : "
-                + f"{len(to_import)} activity⸱ies import"
+                f"Listing of {user.email} resumed at page {checkpoint['page']} : "
+                + f"{len(available_ids)} activity⸱ies already listed"
+            )
+        for page, activities_ids in self.strava.get_activities_ids_pages(
+            user, after, checkpoint["page"]
+        ):
+            available_ids.extend(activities_ids)
+            self.sync_checkpoint.save_page(user.email, page, activities_ids)
+        logger.info(
+            f"{'Full' if full_sync else 'Incremental'} synchronization "
+            + f"of {user.email} after {after}"
+        )
+        to_import = list(set(available_ids) - set(imported_ids))
+        logger.info(
+            f"{len(imported_ids)} activity⸱ies in database &"
+            + f"{len(available_ids)} activity⸱ies on API : "
+            + f"{len(to_import)} activity⸱ies import"
+        )
+        plan = {
+            "to_import": to_import,
+            # Deleted activities can only be detected when every activity is listed
+            "to_delete": (
+                list(set(imported_ids) - set(available_ids)) if full_sync else []
+            ),
+            "full_sync": full_sync,
+            "sync_start": sync_start.timestamp(),
+            "count": cursor["count"],
+            "new_activities": len(to_import),
+        }
+        self.sync_checkpoint.save_plan(user.email, plan)
+        return plan
+
+    def import_activities(
+        self, user: User, activities_ids: list[str], on_fetched: Callable[[], None]
+    ):
+        """Fetches the activities concurrently and saves them by batches,
+        on_fetched being called after each activity fetched.
+        Each saved batch is marked as completed in the synchronization checkpoint.\n
+        Raises RateLimitReached once the API quota is reached, or requests.HTTPError
+        if an activity can't be fetched, the activities already fetched are saved"""
+
+        def save_batch(batch: list[Activity]):
+            self.save_activities(user, batch)
+            self.sync_checkpoint.add_completed(
+                user.email, [str(activity.id) for activity in batch]
             )
 
-            for i, activity_id in enumerate(to_import[:5]):
+        batch = []
+        try:
+            for activity_details in self.strava.get_activities(user, activities_ids):
+                if activity_details:
+                    batch.append(Activity(activity_details))
+                if len(batch) >= self.conf.SYNC["batch_size"]:
+                    # Reset first so that a failed save is not retried by finally
+                    full_batch, batch = batch, []
+                    save_batch(full_batch)
+                on_fetched()
+        finally:
+            # Keeps the fetched activities if the quota is reached
+            if batch:
+                save_batch(batch)
+
+    def get_missing_ids(self, user: User, activities_ids: list[str]) -> list[str]:
+        """Returns the given activities not imported yet"""
+        return list(set(activities_ids) - set(self.postgres.get_activities_ids(user)))
+
+    def finish_synchronization(self, user: User, task: Task, plan: dict) -> dict:
+        """Finishes the synchronization planned by list_synchronization once the
+        activities are imported.\n
+        On a full synchronization, deletes the non-existing activities
+        and completes the activities imported before the simplified tracks
+        and the locations existed.\n
+        The hexagons of a user imported before they were stored are built
+        by the first synchronization finished, full or not"""
+        if plan["full_sync"]:
+            if plan["to_delete"]:
                 task.update_state(
-                    state="PROGRESS",
-                    meta={
-                        "status": f"Importing new activities : {i}/{len(to_import)}",
-                        "current": i,
-                        "total": len(to_import),
-                    },
-                )
-                self.postgres.save_activity(
-                    Activity(self.strava.get_activity(user, activity_id))
+                    state="PROGRESS", meta={"status": "Cleaning old activities"}
                 )
+                self.delete_activities(user, plan["to_delete"])
 
-        if to_delete := list(set(imported_ids) - set(available_ids)):
+            unsimplified = self.postgres.get_unsimplified_tracks(user)
+            self._simplify_tracks(unsimplified)
+            if unlocated := [
+                Activity({"id": activity_id, "track": track})
+                for activity_id, track in self.postgres.get_unlocated_tracks(
+                    user
+                ).items()
+            ]:
+                self._locate_activities(unlocated)
+                self.postgres.update_locations(unlocated)
+            # The tiles rendered before the completion of the activities are stale
+            if unsimplified or unlocated:
+                self.increment_data_version(user)
+
+            user.last_full_sync = datetime.fromtimestamp(plan["sync_start"])
+            self.postgres.update_user_details(
+                user, {"last_full_sync": user.last_full_sync}
+            )
+
+        # The activities imported until then were skipped by _update_hexbins
+        if not user.hexbins_built:
             task.update_state(
-                state="PROGRESS", meta={"status": "Cleaning old activities"}
+                state="PROGRESS", meta={"status": "Building the hexagons"}
             )
-            self.postgres.delete_activities(to_delete)
+            self._rebuild_hexbins(user)
+            self.increment_data_version(user)
 
+        self.sync_checkpoint.clear(user.email)
+        logger.debug(f"Strava session : {self.strava.get_session_metrics()}")
+        # Only the activities actually saved are counted,
+        # the ones not found anymore being skipped
+        total_activities = self.postgres.get_sync_cursor(user)["count"]
         return {
-            "new_activities": len(to_import),
-            "total_activities": len(imported_ids) + len(to_import) - len(to_delete),
+            "new_activities": total_activities - plan["count"] + len(plan["to_delete"]),
+            "total_activities": total_activities,
         }
@@ -10,7 +10,15 @@ if __name__ == "__main__":
 # pylint: disable=wrong-import-position
 from . import tasks
 from .setup import celery_app  # pylint: disable=unused-import
-from .setup import CONF, flask_app, login_manager, routes, users_manager
+from .setup import (
+    CONF,
+    flask_app,
+    login_manager,
+    progress,
+    routes,
+    sync_scheduler,
+    users_manager,
+)
 
 # pylint: enable=wrong-import-position
 
@@ -60,7 +68,14 @@ def home():
 @flask_login.login_required
 def synchronize_activities():
     """PUT synchronizes the activites of the user from Strava"""
-    return routes.synchronize_activities(tasks.synchronize_activities)
+    return routes.synchronize_activities(tasks.synchronize_activities, sync_scheduler)
+
+
+@flask_app.route("/strava_webhook", methods=["GET", "POST"])
+def strava_webhook():
+    """GET validates the Strava push subscription\n
+    POST receives the events of the activities"""
+    return routes.strava_webhook(tasks.process_activity_event)
 
 
 @flask_app.route("/task_status/<task_id>", methods=["GET"])
@@ -69,6 +84,57 @@ def task_status(task_id: str):
     return routes.task_status(task_id)
 
 
+@flask_app.route("/task_progress/<task_id>", methods=["GET"])
+def task_progress(task_id: str):
+    """GET the stream of the status of the provided task_id"""
+    return routes.task_progress(task_id, progress)
+
+
+@flask_app.route("/sync_metrics", methods=["GET"])
+@flask_login.login_required
+def sync_metrics():
+    """GET the metrics of the synchronization queues"""
+    return routes.sync_metrics(sync_scheduler)
+
+
+@flask_app.route("/hexbins", methods=["GET"])
+@flask_login.login_required
+def hexbins():
+    """GET the hexagons crossed by the activities of the user"""
+    return routes.hexbins()
+
+
+@flask_app.route("/tracks", methods=["GET"])
+@flask_login.login_required
+def tracks():
+    """GET the tracks of the activities of the user for the zoom of the map"""
+    return routes.tracks()
+
+
+@flask_app.route("/heatmap/<int:z>/<int:x>/<int:y>.png", methods=["GET"])
+@flask_login.login_required
+def heatmap(z: int, x: int, y: int):
+    """GET the heatmap tile of the activities of the user"""
+    return routes.heatmap(z, x, y)
+
+
+@flask_app.route(
+    "/height_maps/<int:resolution>/<int(signed=True):q>/<int(signed=True):r>.png",
+    methods=["GET"],
+)
+@flask_login.login_required
+def height_map(resolution: int, q: int, r: int):
+    """GET the height map of the roof of a hexagon for the activities of the user"""
+    return routes.height_map(resolution, q, r)
+
+
+@flask_app.route("/geometry", methods=["GET"])
+@flask_login.login_required
+def geometry():
+    """GET the tracks of the activities of the user as compact binary columns"""
+    return routes.geometry()
+
+
 @flask_app.route("/map", methods=["GET"])
 @flask_login.login_required
 def map():
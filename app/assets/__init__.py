@@ -1,4 +1,5 @@
 """Module used to export the assets"""
 
 from .activity import Activity
+from .activity_batch import ActivityBatch
 from .user import User
@@ -1,6 +1,8 @@
 """Module used to manage the Activity asset"""
 
 from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import Callable, Optional
 
 
 class Activity:
@@ -18,17 +20,77 @@ class Activity:
         "duration",
         "speed",
         "elevation",
+        "bbox",
+        "start_point",
     )
 
-    def __init__(self, import_details: dict):
-        self.email: str = import_details["email"]
-        self.id: str = import_details["id"]
-        self.sport: str = import_details["sport"]
-        self.name: str = import_details["name"]
-        self.description: str = import_details["description"]
-        self.track: str = import_details["track"]
-        self.start_date: datetime = import_details["start_date"]
-        self.distance: float = import_details["distance"]
-        self.duration: timedelta = import_details["duration"]
-        self.speed: float = import_details["speed"]
-        self.elevation: float = import_details["elevation"]
+    # The track is stored in _track to be loaded on demand by the track property
+    __slots__ = tuple(column for column in SCHEMA if column != "track") + (
+        "_track",
+        "_track_loader",
+    )
+
+    def __init__(
+        self,
+        import_details: dict,
+        track_loader: Optional[Callable[[str], Optional[str]]] = None,
+    ):
+        """Creates the activity, the columns missing from import_details are None.\n
+        If the track is missing, it is loaded on first access with track_loader"""
+        self.email: str = import_details.get("email")
+        self.id: str = import_details.get("id")
+        self.sport: str = import_details.get("sport")
+        self.name: str = import_details.get("name")
+        self.description: str = import_details.get("description")
+        self._track: Optional[str] = import_details.get("track")
+        self.start_date: datetime = import_details.get("start_date")
+        self.distance: float = import_details.get("distance")
+        self.duration: timedelta = import_details.get("duration")
+        self.speed: float = import_details.get("speed")
+        self.elevation: float = import_details.get("elevation")
+        # Geometric PostgreSQL values "(lng, lat),(lng, lat)" and "(lng, lat)"
+        self.bbox: Optional[str] = import_details.get("bbox")
+        self.start_point: Optional[str] = import_details.get("start_point")
+        self._track_loader = track_loader
+
+    @classmethod
+    def from_row(
+        cls,
+        row: tuple,
+        columns: tuple = SCHEMA,
+        track_loader: Optional[Callable[[str], Optional[str]]] = None,
+    ) -> "Activity":
+        """Creates the activity straight from a database row of the given columns,
+        without the intermediate dict, the columns missing are None"""
+        attributes, missing_attributes = get_row_attributes(columns)
+        activity = cls.__new__(cls)
+        for attribute in missing_attributes:
+            setattr(activity, attribute, None)
+        for attribute, value in zip(attributes, row):
+            setattr(activity, attribute, value)
+        activity._track_loader = track_loader
+        return activity
+
+    @property
+    def track(self) -> Optional[str]:
+        """Encoded polyline of the activity, loaded on demand if not imported"""
+        if self._track is None and self._track_loader:
+            self._track = self._track_loader(self.id)
+        return self._track
+
+    def to_dict(self) -> dict:
+        """Returns the activity as a dict following the SCHEMA"""
+        return {column: getattr(self, column) for column in self.SCHEMA}
+
+
+@lru_cache
+def get_row_attributes(columns: tuple) -> tuple[tuple, tuple]:
+    """Returns the attributes set by the columns of a row and the missing ones,
+    computed once for each set of columns"""
+    attributes = tuple("_track" if column == "track" else column for column in columns)
+    missing_attributes = tuple(
+        attribute
+        for attribute in Activity.__slots__
+        if attribute not in attributes and attribute != "_track_loader"
+    )
+    return attributes, missing_attributes
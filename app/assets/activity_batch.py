@@ -0,0 +1,50 @@
+"""Module used to manage the Activity Batch asset"""
+
+from typing import Iterable
+
+import numpy as np
+
+
+class ActivityBatch:
+    """Activity Batch class storing many activities as NumPy columns,
+    for the bulk operations over the history of a user"""
+
+    # Missing values are NaN for the floats and NaT for the dates and durations
+    DTYPES = {
+        "id": object,
+        "sport": object,
+        "start_date": "datetime64[s]",
+        "distance": np.float64,
+        "duration": "timedelta64[s]",
+        "speed": np.float64,
+        "elevation": np.float64,
+    }
+
+    # The columns in the order of the DTYPES
+    SCHEMA = tuple(DTYPES)
+
+    __slots__ = SCHEMA
+
+    def __init__(self, columns: dict[str, np.ndarray]):
+        """Creates the batch from a dict {column: values} following the SCHEMA"""
+        self.id: np.ndarray = columns["id"]
+        self.sport: np.ndarray = columns["sport"]
+        self.start_date: np.ndarray = columns["start_date"]
+        self.distance: np.ndarray = columns["distance"]
+        self.duration: np.ndarray = columns["duration"]
+        self.speed: np.ndarray = columns["speed"]
+        self.elevation: np.ndarray = columns["elevation"]
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[tuple]) -> "ActivityBatch":
+        """Creates the batch from the database rows of the SCHEMA columns"""
+        values = list(zip(*rows)) or [() for _ in cls.SCHEMA]
+        return cls(
+            {
+                column: np.array(column_values, dtype=cls.DTYPES[column])
+                for column, column_values in zip(cls.SCHEMA, values)
+            }
+        )
+
+    def __len__(self) -> int:
+        return len(self.id)
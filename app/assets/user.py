@@ -1,6 +1,7 @@
 """Module used to manage the User asset"""
 
 from datetime import datetime
+from typing import Optional
 
 
 class User:
@@ -17,8 +18,13 @@ class User:
         "strava_expires_date",
         "strava_refresh_token",
         "import_task_id",
+        "last_full_sync",
+        "data_version",
+        "hexbins_built",
     )
 
+    __slots__ = SCHEMA
+
     def __init__(self, user_details: dict):
         self.email: str = user_details["email"]
         self.password: str = user_details["password"]
@@ -30,6 +36,11 @@ class User:
         self.strava_expires_date: datetime = user_details["strava_expires_date"]
         self.strava_refresh_token: str = user_details["strava_refresh_token"]
         self.import_task_id: str = user_details["import_task_id"]
+        self.last_full_sync: Optional[datetime] = user_details["last_full_sync"]
+        # Incremented each time activities are imported or deleted
+        self.data_version: int = user_details["data_version"]
+        # Whether the activities are counted in the table `hexbins`
+        self.hexbins_built: bool = user_details["hexbins_built"]
 
     def to_dict(self) -> dict:
         """Returns the user as a json serializable dict"""
@@ -44,8 +55,30 @@ class User:
             "strava_expires_date": self.strava_expires_date.timestamp(),
             "strava_refresh_token": self.strava_refresh_token,
             "import_task_id": self.import_task_id,
+            "last_full_sync": (
+                self.last_full_sync.timestamp() if self.last_full_sync else None
+            ),
+            "data_version": self.data_version,
+            "hexbins_built": self.hexbins_built,
         }
 
+    @classmethod
+    def from_dict(cls, user_dict: dict) -> "User":
+        """Creates the user from the json serializable dict returned by to_dict"""
+        return cls(
+            user_dict
+            | {
+                "strava_expires_date": datetime.fromtimestamp(
+                    user_dict["strava_expires_date"]
+                ),
+                "last_full_sync": (
+                    datetime.fromtimestamp(user_dict["last_full_sync"])
+                    if user_dict["last_full_sync"]
+                    else None
+                ),
+            }
+        )
+
     def is_authenticated(self):
         """Mandatory flask function"""
         return True
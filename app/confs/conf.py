@@ -21,11 +21,40 @@ class Conf:
             "password": os.environ["POSTGRES_PASSWORD"],
             "host": os.environ["POSTGRES_HOST"],
             "port": 5432,
+            # Rows fetched at once by the server-side cursors streaming the activities
+            "itersize": 1000,
+            "pool": {
+                "min_size": 1,
+                "max_size": 10,
+                # Idle connections are checked with a query before being reused
+                "health_check_interval": 30,
+            },
         }
 
         self.REDIS = {
             "broker_url": os.environ["REDIS_BROKER_URL"],
             "result_backend_url": os.environ["REDIS_RESULT_BACKEND_URL"],
+            "rate_limiter_prefix": "strava_rate_limiter",
+            "user_cache_prefix": "users",
+            "progress_prefix": "task_progress",
+            "sync_checkpoint_prefix": "sync_checkpoint",
+            "sync_scheduler_prefix": "sync_scheduler",
+            # The users are invalidated on each update, the expiration only bounds
+            # the staleness of a user cached while being updated
+            "user_cache_ttl": 300,
+            # Delay after which a task not acknowledged is delivered again,
+            # longer than the pause of the API quota of the rescheduled tasks
+            "visibility_timeout": int(timedelta(hours=26).total_seconds()),
+        }
+
+        self.PROGRESS = {
+            # Comment sent when nothing happens, to keep the stream open
+            "keepalive_interval": 15,
+            # The stream is closed after this delay to free the server thread,
+            # the browser reconnects to it automatically
+            "max_stream_duration": 300,
+            # Expiration of the progress counters of the subtasks
+            "counter_ttl": timedelta(days=1),
         }
 
         self.STRAVA = {
@@ -58,14 +87,108 @@ class Conf:
                 },
             },
             "spam_limit": 0.8,
+            # Maximum number of activities fetched at the same time
+            "concurrency": 4,
+            "session": {
+                # Kept above the concurrency so every thread reuses a connection
+                "pool_size": 8,
+                "retries": 3,
+                "backoff_factor": 0.5,
+            },
             "get_activities": {
                 "url": "https://www.strava.com/api/v3/athlete/activities",
                 "params": {
                     "page": None,
                     "per_page": 100,
+                    "after": None,
                 },
             },
             "get_activity": {
                 "url": "https://www.strava.com/api/v3/activities/{id}",
             },
+            "webhook": {
+                # Token given to Strava when creating the push subscription
+                "verify_token": os.environ["STRAVA_WEBHOOK_VERIFY_TOKEN"],
+                # Id of the push subscription, sent by Strava with each event
+                "subscription_id": os.environ["STRAVA_WEBHOOK_SUBSCRIPTION_ID"],
+            },
+        }
+
+        self.HEXBIN = {
+            # Size of the hexagons at resolution 0, in Web Mercator meters
+            "base_size": 100_000,
+            "default_resolution": 8,
+            "max_resolution": 14,
+            # Resolutions kept up to date in the table `hexbins` at each import,
+            # the finer ones are binned on demand
+            "stored_resolutions": list(range(11)),
+        }
+
+        self.TRACKS = {
+            # Douglas-Peucker tolerance of each level of detail, in meters
+            "tolerances": [5, 20, 80, 320, 1280],
+        }
+
+        self.TILES = {
+            "size": 256,
+            "max_zoom": 18,
+            # Shared by the web server and the worker through the mounted volume
+            "cache_folder": "cache/tiles",
+            "max_cache_size": 512 * 1024**2,
+            # The least recently used tiles are evicted every given number of writes
+            "eviction_interval": 100,
+        }
+
+        self.HEIGHT_MAPS = {
+            # Side of the texture covering the roof of a hexagon, in pixels
+            "size": 64,
+            # Number of visits of a pixel reaching the full height
+            "max_visits": 50,
+        }
+
+        self.SYNC = {
+            # A full listing is forced after this delay to catch the deletions
+            "full_sync_interval": timedelta(days=7),
+            # Start dates are stored in local time, the cursor is moved back to
+            # make sure no activity is missed whatever the timezone
+            "cursor_margin": timedelta(days=1),
+            # Number of fetched activities written to the database at once
+            "batch_size": 200,
+            # Number of activities fetched by each task, the chunks of a large
+            # synchronization being spread across the workers
+            "chunk_size": 500,
+            # An interrupted synchronization resumes from its checkpoint until it
+            # expires, covering the longest pause of the API quota
+            "checkpoint_ttl": timedelta(days=2),
+            # A synchronization without progress for this delay, e.g. once its
+            # worker is killed, can be triggered again to resume from its
+            # checkpoint. It covers the wait of the chunks behind the other users
+            "lease_ttl": timedelta(minutes=10),
+            # The tasks failing on an API error are retried after this delay,
+            # this number of times in total with the pauses of the API quota
+            "error_retry_delay": 60,
+            "error_retries": 5,
+        }
+
+        self.SCHEDULER = {
+            # Queue of the synchronizations and the events, consumed first as
+            # their priorities are above the ones of the backfill queue
+            "sync_queue": "sync",
+            # Queue of the chunks of the large synchronizations
+            "backfill_queue": "backfill",
+            # Number of message priorities, 0 being the highest on Redis
+            "priorities": 10,
+            # Priority of the full synchronizations, after the incremental ones,
+            # the chunks of the backfills taking the next priorities
+            "full_sync_priority": 1,
+            # Number of chunks of a synchronization imported in parallel, each lane
+            # importing its chunks one after the other in turns with the others
+            "chunk_lanes": 4,
+            # Share of the 15 minutes limits above which each user is limited
+            # to an equal share of the API budget
+            "fair_share_threshold": 0.5,
+            # Number of the latest wait times of each queue kept for the metrics
+            "wait_times_size": 1000,
+            # The wait time of a task not started after this delay is dropped
+            "enqueued_ttl": timedelta(days=1),
         }
@@ -1,28 +1,46 @@
 """Module used to read the SQL requests"""
 
 
+def read(path: str) -> str:
+    """Returns the content of the SQL file"""
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
+
 class SQL:
     """SQL class to access the sql requests"""
 
     def __init__(self):
         # ========== USER ==========
         folder = "app/sql/users"
-        with open(f"{folder}/get_user.sql", "r", encoding="utf-8") as f:
-            self.get_user = f.read()
-
-        with open(f"{folder}/insert_user.sql", "r", encoding="utf-8") as f:
-            self.insert_user = f.read()
-
-        with open(f"{folder}/update_user.sql", "r", encoding="utf-8") as f:
-            self.update_user = f.read()
+        self.get_user = read(f"{folder}/get_user.sql")
+        self.get_user_by_strava_id = read(f"{folder}/get_user_by_strava_id.sql")
+        self.insert_user = read(f"{folder}/insert_user.sql")
+        self.update_user = read(f"{folder}/update_user.sql")
+        self.increment_data_version = read(f"{folder}/increment_data_version.sql")
 
         # ========== ACTIVITIES ==========
         folder = "app/sql/activities"
-        with open(f"{folder}/get_activities.sql", "r", encoding="utf-8") as f:
-            self.get_activities = f.read()
-
-        with open(f"{folder}/insert_activity.sql", "r", encoding="utf-8") as f:
-            self.insert_activity = f.read()
-
-        with open(f"{folder}/delete_activities.sql", "r", encoding="utf-8") as f:
-            self.delete_activities = f.read()
+        self.get_activities = read(f"{folder}/get_activities.sql")
+        self.get_activity_track = read(f"{folder}/get_activity_track.sql")
+        self.get_activities_tracks = read(f"{folder}/get_activities_tracks.sql")
+        self.get_activities_ids = read(f"{folder}/get_activities_ids.sql")
+        self.get_activities_stats = read(f"{folder}/get_activities_stats.sql")
+        self.get_sync_cursor = read(f"{folder}/get_sync_cursor.sql")
+        self.insert_activities = read(f"{folder}/insert_activities.sql")
+        self.get_unlocated_tracks = read(f"{folder}/get_unlocated_tracks.sql")
+        self.update_locations = read(f"{folder}/update_locations.sql")
+        self.delete_activities = read(f"{folder}/delete_activities.sql")
+
+        # ========== HEXBINS ==========
+        folder = "app/sql/hexbins"
+        self.get_hexbins = read(f"{folder}/get_hexbins.sql")
+        self.upsert_hexbins = read(f"{folder}/upsert_hexbins.sql")
+        self.delete_empty_hexbins = read(f"{folder}/delete_empty_hexbins.sql")
+        self.delete_hexbins = read(f"{folder}/delete_hexbins.sql")
+
+        # ========== TRACKS ==========
+        folder = "app/sql/tracks"
+        self.get_tracks = read(f"{folder}/get_tracks.sql")
+        self.get_unsimplified_tracks = read(f"{folder}/get_unsimplified_tracks.sql")
+        self.insert_tracks = read(f"{folder}/insert_tracks.sql")
@@ -0,0 +1,42 @@
+"""Module used to encode the activities into a compact binary geometry for the map"""
+
+import numpy as np
+
+from . import polyline
+
+# Coordinates are quantized at the precision of the encoded polylines, losslessly
+SCALE = 10**polyline.PRECISION
+
+
+def encode_geometry(
+    coords: np.ndarray,
+    offsets: np.ndarray,
+    start_dates: np.ndarray,
+    sports: np.ndarray,
+) -> bytes:
+    """Encodes a ragged batch of tracks, as returned by polyline.decode_batch,
+    with the metadata of their activities into little-endian columns,
+    each one following the previous one and aligned for the JS typed arrays:
+    - start_dates : float64 [n], seconds since epoch of the local start dates
+    - offsets : int32 [n + 1], index of the first point of each activity
+    - coords : int32 [points, 2], [latitude, longitude] * SCALE, the first point
+    of each activity being absolute and the others deltas to the previous one
+    - sports : uint8 [n], index of the sport of each activity"""
+    quantized = np.rint(coords * SCALE).astype(np.int32)
+    deltas = quantized.copy()
+    deltas[1:] -= quantized[:-1]
+    firsts = offsets[:-1][np.diff(offsets) > 0]
+    deltas[firsts] = quantized[firsts]
+
+    dates = start_dates.astype("datetime64[s]")
+    timestamps = np.where(
+        np.isnat(dates), np.nan, dates.astype(np.int64).astype(np.float64)
+    )
+    return b"".join(
+        [
+            timestamps.astype("<f8").tobytes(),
+            offsets.astype("<i4").tobytes(),
+            deltas.astype("<i4").tobytes(),
+            sports.astype("u1").tobytes(),
+        ]
+    )
@@ -0,0 +1,162 @@
+"""Module used to rasterize the tracks into heatmap tiles and height maps"""
+
+import struct
+import zlib
+
+import numpy as np
+
+from . import hexbin
+
+# Width of the Web Mercator projection, in meters
+WORLD_SIZE = 2 * np.pi * hexbin.EARTH_RADIUS
+
+# Color ramp of the heatmap, from the least to the most visited pixels
+COLOR_STOPS = np.array([0, 0.5, 1])
+COLORS = np.array([[252, 82, 0], [255, 140, 0], [255, 255, 220]])
+
+# Longest segment rasterized, in pixels, to bound the work at high zoom levels
+MAX_SEGMENT_LENGTH = 1024
+
+
+def get_tile_bbox(z: int, x: int, y: int) -> tuple[float, float, float, float]:
+    """Returns the (min_latitude, min_longitude, max_latitude, max_longitude)
+    bbox of the slippy map tile"""
+    number_of_tiles = 2**z
+
+    def latitude(tile_y: int) -> float:
+        return np.degrees(
+            np.arctan(np.sinh(np.pi * (1 - 2 * tile_y / number_of_tiles)))
+        )
+
+    return (
+        latitude(y + 1),
+        x / number_of_tiles * 360 - 180,
+        latitude(y),
+        (x + 1) / number_of_tiles * 360 - 180,
+    )
+
+
+def to_pixels(coords: np.ndarray, z: int, x: int, y: int, size: int) -> np.ndarray:
+    """Converts [latitude, longitude] coords into [column, row] pixels of the tile"""
+    points = hexbin.project(coords)
+    scale = size * 2**z / WORLD_SIZE
+    return np.column_stack(
+        (
+            (points[:, 0] + WORLD_SIZE / 2) * scale - x * size,
+            (WORLD_SIZE / 2 - points[:, 1]) * scale - y * size,
+        )
+    )
+
+
+def hex_to_pixels(
+    coords: np.ndarray, center: np.ndarray, hex_size: float, size: int
+) -> np.ndarray:
+    """Converts [latitude, longitude] coords into [column, row] pixels of the texture
+    of the hexagon, covering the square of side 2 * hex_size around its center
+    like the UVs of the roof of Tile.js"""
+    points = hexbin.project(coords)
+    scale = size / (2 * hex_size)
+    return np.column_stack(
+        (
+            (points[:, 0] - center[0] + hex_size) * scale,
+            (center[1] + hex_size - points[:, 1]) * scale,
+        )
+    )
+
+
+def clip_segments(
+    pixels: np.ndarray, offsets: np.ndarray, size: int
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Returns the starts, the ends and the tracks of the segments between two
+    consecutive points of the same track, skipping the ones entirely on one side
+    of the tile"""
+    tracks = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+    same_track = tracks[1:] == tracks[:-1]
+    starts, ends = pixels[:-1][same_track], pixels[1:][same_track]
+    visible = ~(
+        ((starts < 0) & (ends < 0)).any(axis=1)
+        | ((starts >= size) & (ends >= size)).any(axis=1)
+    )
+    return starts[visible], ends[visible], tracks[1:][same_track][visible]
+
+
+def sample_segments(
+    starts: np.ndarray, ends: np.ndarray
+) -> tuple[np.ndarray, np.ndarray]:
+    """Samples each segment about once per pixel along its length,
+    returns the sampled points and the index of their segment"""
+    lengths = np.abs(ends - starts).max(axis=1, initial=0)
+    samples = np.minimum(np.ceil(lengths), MAX_SEGMENT_LENGTH).astype(np.int64) + 1
+    first_samples = np.cumsum(samples) - samples
+    segment_index = np.repeat(np.arange(len(samples)), samples)
+    steps = np.arange(samples.sum()) - first_samples[segment_index]
+    ratios = steps / np.maximum(samples - 1, 1)[segment_index]
+    points = (
+        starts[segment_index]
+        + (ends[segment_index] - starts[segment_index]) * ratios[:, None]
+    )
+    return points, segment_index
+
+
+def rasterize(pixels: np.ndarray, offsets: np.ndarray, size: int) -> np.ndarray:
+    """Rasterizes a ragged batch of tracks converted to [column, row] pixels,
+    with the offsets returned by polyline.decode_batch,
+    into a (size, size) array of the number of tracks crossing each pixel"""
+    starts, ends, segment_tracks = clip_segments(pixels, offsets, size)
+    points, segment_index = sample_segments(starts, ends)
+
+    columns, rows = np.floor(points).astype(np.int64).T
+    inside = (columns >= 0) & (columns < size) & (rows >= 0) & (rows < size)
+    cells = rows[inside] * size + columns[inside]
+
+    # A track is counted once per pixel whatever its number of samples in it
+    visited = np.unique(segment_tracks[segment_index[inside]] * size**2 + cells)
+    return np.bincount(visited % size**2, minlength=size**2).reshape(size, size)
+
+
+def colorize(visits: np.ndarray) -> np.ndarray:
+    """Converts the visits into a (size, size, 4) RGBA image,
+    the transparency and the color following the log of the visits"""
+    intensities = np.log1p(visits) / np.log1p(max(visits.max(), 1))
+    image = np.zeros((*visits.shape, 4), dtype=np.uint8)
+    for channel in range(3):
+        image[..., channel] = np.interp(intensities, COLOR_STOPS, COLORS[:, channel])
+    image[..., 3] = np.where(visits > 0, 96 + intensities * 159, 0)
+    return image
+
+
+def to_heights(visits: np.ndarray, max_visits: int) -> np.ndarray:
+    """Converts the visits into a grayscale height map following the log of the
+    visits, saturating at max_visits so the heights are comparable between maps"""
+    return np.round(
+        255 * np.minimum(np.log1p(visits) / np.log1p(max_visits), 1)
+    ).astype(np.uint8)
+
+
+def encode_png(image: np.ndarray) -> bytes:
+    """Encodes a (height, width) grayscale or a (height, width, 4) RGBA image
+    into a PNG"""
+    height, width = image.shape[:2]
+    channels, color_type = (4, 6) if image.ndim == 3 else (1, 0)
+
+    def chunk(chunk_type: bytes, data: bytes) -> bytes:
+        return (
+            struct.pack(">I", len(data))
+            + chunk_type
+            + data
+            + struct.pack(">I", zlib.crc32(chunk_type + data))
+        )
+
+    # Each row starts with the filter type, 0 being no filter
+    rows = np.hstack(
+        (
+            np.zeros((height, 1), dtype=np.uint8),
+            image.reshape(height, width * channels),
+        )
+    )
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, color_type, 0, 0, 0))
+        + chunk(b"IDAT", zlib.compress(rows.tobytes(), 6))
+        + chunk(b"IEND", b"")
+    )
@@ -0,0 +1,168 @@
+"""Module used to bin the tracks points into a hexagonal grid with NumPy"""
+
+from typing import Optional
+
+import numpy as np
+
+# Radius used by the Web Mercator projection, in meters
+EARTH_RADIUS = 6378137
+# Latitude beyond which the Web Mercator projection is not defined
+MAX_LATITUDE = 85.05112878
+
+SQRT_3 = np.sqrt(3)
+
+# Above this extent, the hexagons are counted by sorting instead of a dense array
+MAX_DENSE_CELLS = 2**24
+
+
+def get_hex_size(base_size: float, resolution: int) -> float:
+    """Returns the size (center to corner) of the hexagons in Web Mercator meters,
+    each resolution level halving the size of the previous one"""
+    return base_size / 2**resolution
+
+
+def project(coords: np.ndarray) -> np.ndarray:
+    """Projects a (n, 2) array of [latitude, longitude] to Web Mercator [x, y] meters"""
+    latitudes = np.radians(np.clip(coords[:, 0], -MAX_LATITUDE, MAX_LATITUDE))
+    longitudes = np.radians(coords[:, 1])
+    return np.column_stack(
+        (
+            EARTH_RADIUS * longitudes,
+            EARTH_RADIUS * np.log(np.tan(np.pi / 4 + latitudes / 2)),
+        )
+    )
+
+
+def unproject(points: np.ndarray) -> np.ndarray:
+    """Converts a (n, 2) array of Web Mercator [x, y] meters to [latitude, longitude]"""
+    return np.column_stack(
+        (
+            np.degrees(2 * np.arctan(np.exp(points[:, 1] / EARTH_RADIUS)) - np.pi / 2),
+            np.degrees(points[:, 0] / EARTH_RADIUS),
+        )
+    )
+
+
+def points_to_hexes(points: np.ndarray, size: float) -> tuple[np.ndarray, np.ndarray]:
+    """Returns the axial coordinates (q, r) of the pointy-top hexagons,
+    as drawn by Tile.js, containing the projected points"""
+    q = (SQRT_3 / 3 * points[:, 0] - points[:, 1] / 3) / size
+    r = (2 / 3 * points[:, 1]) / size
+    s = -q - r
+
+    # Cube rounding, the coordinate with the largest error is recomputed
+    rounded_q, rounded_r, rounded_s = np.rint(q), np.rint(r), np.rint(s)
+    error_q = np.abs(rounded_q - q)
+    error_r = np.abs(rounded_r - r)
+    error_s = np.abs(rounded_s - s)
+    fix_q = (error_q > error_r) & (error_q > error_s)
+    fix_r = ~fix_q & (error_r > error_s)
+    rounded_q = np.where(fix_q, -rounded_r - rounded_s, rounded_q)
+    rounded_r = np.where(fix_r, -rounded_q - rounded_s, rounded_r)
+
+    return rounded_q.astype(np.int32), rounded_r.astype(np.int32)
+
+
+def hexes_to_points(q: np.ndarray, r: np.ndarray, size: float) -> np.ndarray:
+    """Returns the projected [x, y] centers of the pointy-top hexagons"""
+    return np.column_stack(
+        (size * (SQRT_3 * q + SQRT_3 / 2 * r), size * 3 / 2 * np.asarray(r))
+    )
+
+
+def rows_to_hexbins(rows: list[tuple]) -> dict[str, np.ndarray]:
+    """Converts (q, r, counts, visits) rows into the columns returned by bin_tracks"""
+    columns = np.array(rows, dtype=np.int32).reshape(-1, 4)
+    return {
+        column: columns[:, i] for i, column in enumerate(["q", "r", "counts", "visits"])
+    }
+
+
+def crop_hexbins(
+    hexbins: dict[str, np.ndarray],
+    size: float,
+    bbox: tuple[float, float, float, float],
+) -> dict[str, np.ndarray]:
+    """Keeps the hexagons whose center is in the bbox,
+    (min_latitude, min_longitude, max_latitude, max_longitude)"""
+    centers = hexes_to_points(hexbins["q"], hexbins["r"], size)
+    corners = project(np.array([bbox[:2], bbox[2:]], dtype=np.float64))
+    inside = np.all((centers >= corners[0]) & (centers <= corners[1]), axis=1)
+    return {column: values[inside] for column, values in hexbins.items()}
+
+
+def count_cells(
+    cells: np.ndarray, number_of_cells: int, tracks: np.ndarray
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Returns the cells containing at least one point, with their number of points
+    and their number of visiting tracks, given the cell and the track of each point"""
+    # The cells are counted in linear time if they fit in a dense array,
+    # instead of being sorted
+    if number_of_cells <= MAX_DENSE_CELLS:
+        counts = np.bincount(cells, minlength=number_of_cells)
+        used = counts > 0
+        used_cells = np.flatnonzero(used)
+        counts = counts[used_cells]
+        hexes = (np.cumsum(used) - 1)[cells]
+    else:
+        used_cells, hexes, counts = np.unique(
+            cells, return_inverse=True, return_counts=True
+        )
+
+    # A track is counted once per hexagon whatever its number of points in it,
+    # consecutive points in the same hexagon are skipped before deduplicating.
+    # The used hexagons are indexed compactly, as the extent may not fit in memory
+    number_of_hexes = len(used_cells)
+    changes = np.ones(len(cells), dtype=bool)
+    changes[1:] = (cells[1:] != cells[:-1]) | (tracks[1:] != tracks[:-1])
+    visited = np.unique(
+        tracks[changes].astype(np.int64) * number_of_hexes + hexes[changes]
+    )
+    visits = np.bincount(visited % number_of_hexes, minlength=number_of_hexes)
+    return used_cells, counts, visits
+
+
+def bin_tracks(
+    coords: np.ndarray,
+    offsets: np.ndarray,
+    size: float,
+    bbox: Optional[tuple[float, float, float, float]] = None,
+) -> dict[str, np.ndarray]:
+    """Bins a ragged batch of tracks, as returned by polyline.decode_batch,
+    into the hexagons of the given size.\n
+    bbox is (min_latitude, min_longitude, max_latitude, max_longitude).\n
+    Returns for each hexagon containing at least one point:
+    - q, r : its axial coordinates
+    - counts : the number of points in it
+    - visits : the number of tracks crossing it"""
+    tracks = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+    if bbox is not None:
+        inside = (
+            (coords[:, 0] >= bbox[0])
+            & (coords[:, 1] >= bbox[1])
+            & (coords[:, 0] <= bbox[2])
+            & (coords[:, 1] <= bbox[3])
+        )
+        coords, tracks = coords[inside], tracks[inside]
+
+    q, r = points_to_hexes(project(coords), size)
+    if q.size == 0:
+        return {
+            column: np.zeros(0, dtype=np.int32)
+            for column in ("q", "r", "counts", "visits")
+        }
+
+    # Hexagons are indexed over the extent of the points
+    min_q, min_r = q.min(), r.min()
+    number_of_r = int(r.max()) - int(min_r) + 1
+    cells = (q - min_q).astype(np.int64) * number_of_r + (r - min_r)
+    used_cells, counts, visits = count_cells(
+        cells, (int(q.max()) - int(min_q) + 1) * number_of_r, tracks
+    )
+
+    return {
+        "q": (used_cells // number_of_r + min_q).astype(np.int32),
+        "r": (used_cells % number_of_r + min_r).astype(np.int32),
+        "counts": counts.astype(np.int32),
+        "visits": visits.astype(np.int32),
+    }
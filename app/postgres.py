@@ -1,26 +1,44 @@
 """Module used to communicate with the PostgreSQL Database"""
 
 import logging
-from typing import Any, Dict, Optional, Tuple
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, Iterator, Optional, Tuple
 
 import psycopg2
+import psycopg2.extensions
+import psycopg2.extras
+import psycopg2.pool
 
 from .assets import Activity, User
 from .confs import SQL, Conf
+from .user_cache import UserCache
 
 logger = logging.getLogger(__name__)
 
 
-class Postgres:
+# One method per SQL request
+class Postgres:  # pylint: disable=too-many-public-methods
     """PostgreSQL class to communicate with the database"""
 
-    def __init__(self, conf: Conf, sql: SQL):
+    def __init__(self, conf: Conf, sql: SQL, user_cache: UserCache):
         self.conf = conf
         self.sql = sql
-        self.connection = self._create_new_connection()
+        self.user_cache = user_cache
+        self.lock = threading.Lock()
+        self._pool = None
+        self._pool_pid = None
+        self._pool_slots = None
+        self._last_used = {}
 
-    def _create_new_connection(self):
-        return psycopg2.connect(
+    def _create_new_pool(self) -> psycopg2.pool.ThreadedConnectionPool:
+        return psycopg2.pool.ThreadedConnectionPool(
+            minconn=self.conf.POSTGRES["pool"]["min_size"],
+            maxconn=self.conf.POSTGRES["pool"]["max_size"],
             database=self.conf.POSTGRES["database"],
             host=self.conf.POSTGRES["host"],
             port=self.conf.POSTGRES["port"],
@@ -28,6 +46,71 @@ class Postgres:
             password=self.conf.POSTGRES["password"],
         )
 
+    @property
+    def pool(self) -> psycopg2.pool.ThreadedConnectionPool:
+        """Returns the connection pool of the current process, created on first use
+        as the Celery workers are forked after the import"""
+        with self.lock:
+            if self._pool_pid != os.getpid():
+                self._pool = self._create_new_pool()
+                self._pool_pid = os.getpid()
+                # Makes the threads wait for a connection instead of raising PoolError
+                self._pool_slots = threading.BoundedSemaphore(
+                    self.conf.POSTGRES["pool"]["max_size"]
+                )
+                self._last_used = {}
+            return self._pool
+
+    def is_healthy(self, connection: psycopg2.extensions.connection) -> bool:
+        """Checks if the connection is still usable,
+        only querying the server if it has been idle for a while"""
+        if connection.closed:
+            return False
+        if (
+            time.monotonic() - self._last_used.get(id(connection), 0)
+            < self.conf.POSTGRES["pool"]["health_check_interval"]
+        ):
+            return True
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            connection.rollback()
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            return False
+        return True
+
+    @contextmanager
+    def cursor(
+        self, name: Optional[str] = None
+    ) -> Iterator[psycopg2.extensions.cursor]:
+        """Checks out a healthy connection from the pool and yields a cursor,
+        the transaction is committed on success and rolled back on error.\n
+        If a name is given, the cursor is a server-side cursor"""
+        pool = self.pool
+        with self._pool_slots:
+            connection = pool.getconn()
+            while not self.is_healthy(connection):
+                logger.warning("Dropping a broken connection, reconnecting")
+                self._last_used.pop(id(connection), None)
+                pool.putconn(connection, close=True)
+                connection = pool.getconn()
+
+            try:
+                with connection.cursor(name) as cursor:
+                    yield cursor
+                connection.commit()
+            # Also rolls back the streaming generators closed before their end
+            except BaseException:
+                if not connection.closed:
+                    connection.rollback()
+                raise
+            finally:
+                if connection.closed:
+                    self._last_used.pop(id(connection), None)
+                else:
+                    self._last_used[id(connection)] = time.monotonic()
+                pool.putconn(connection, close=bool(connection.closed))
+
     # ========== UTILS ==========
 
     def res_to_dict(self, res: Optional[Tuple], schema: Tuple) -> dict:
@@ -40,63 +123,279 @@ class Postgres:
         """Converts a dictionary to a SQL string for UPDATE queries"""
         return ", ".join([f"{column} = %({column})s" for column in column_value.keys()])
 
-    def tuple_to_sql(self, values: tuple) -> str:
-        """Converts a tuple to a SQL string for IN queries"""
-        return ", ".join([f"'{value}'" for value in values])
+    def bbox_to_sql(
+        self, bbox: Optional[tuple[float, float, float, float]]
+    ) -> Optional[str]:
+        """Converts a (min_latitude, min_longitude, max_latitude, max_longitude) bbox
+        to a SQL box, x being the longitude"""
+        if bbox is None:
+            return None
+        return f"(({bbox[1]}, {bbox[0]}), ({bbox[3]}, {bbox[2]}))"
+
+    def schema_to_template(self, schema: Tuple) -> str:
+        """Converts a schema to a SQL row template for multi-row INSERT queries"""
+        return "(" + ", ".join([f"%({column})s" for column in schema]) + ")"
 
     # ========== USERS ==========
+    # The cached user is invalidated by every write of the table `users`
 
     def save_user(self, user: User):
         """Saves the user into the table `users`"""
-        with self.connection.cursor() as cursor:
-            cursor.execute(self.sql.insert_user, vars(user))
-            self.connection.commit()
+        with self.cursor() as cursor:
+            cursor.execute(
+                self.sql.insert_user,
+                {column: getattr(user, column) for column in User.SCHEMA},
+            )
 
+        self.user_cache.invalidate(user.email)
         logger.debug(f"User {user.email} saved to the database")
 
     def get_user_details(self, email: str) -> Dict[str, Any]:
         """Gets the user from the table `users`"""
-        with self.connection.cursor() as cursor:
+        with self.cursor() as cursor:
             cursor.execute(self.sql.get_user, {"email": email})
             res = cursor.fetchone()
 
         logger.debug(f"Getting details from {email}")
         return self.res_to_dict(res, User.SCHEMA)
 
+    def get_user_details_by_strava_id(self, strava_user_id: str) -> Dict[str, Any]:
+        """Gets the user of the Strava athlete from the table `users`"""
+        with self.cursor() as cursor:
+            cursor.execute(
+                self.sql.get_user_by_strava_id, {"strava_user_id": strava_user_id}
+            )
+            res = cursor.fetchone()
+
+        logger.debug(f"Getting details from Strava athlete {strava_user_id}")
+        return self.res_to_dict(res, User.SCHEMA)
+
     def update_user_details(self, user: User, details: dict):
         """Updates the data in the table `users`, details is dict {"column_name" : "new_value"}"""
-        with self.connection.cursor() as cursor:
+        with self.cursor() as cursor:
             cursor.execute(
                 self.sql.update_user.format(columns=self.dict_keys_to_sql(details)),
                 {"email": user.email} | details,
             )
-            self.connection.commit()
 
+        self.user_cache.invalidate(user.email)
         logger.debug(f"Updating detail⸱s {list(details.keys())} of user {user.email}")
 
+    def increment_data_version(self, user: User) -> int:
+        """Increments the version of the activities of the user and returns it"""
+        with self.cursor() as cursor:
+            cursor.execute(self.sql.increment_data_version, {"email": user.email})
+            res = cursor.fetchone()
+
+        self.user_cache.invalidate(user.email)
+        logger.debug(f"Data version of user {user.email} incremented to {res[0]}")
+        return res[0]
+
     # ========== ACTIVITIES ==========
 
-    def save_activity(self, activity: Activity):
-        """Saves the activity into the table `activities`"""
-        with self.connection.cursor() as cursor:
-            cursor.execute(self.sql.insert_activity, vars(activity))
-            self.connection.commit()
+    def save_activities(self, activities: list[Activity]) -> list[str]:
+        """Saves the activities into the table `activities` in a single transaction,
+        sending them as a multi-row INSERT.\n
+        Returns the ids of the activities inserted, the existing ones being skipped"""
+        with self.cursor() as cursor:
+            res = psycopg2.extras.execute_values(
+                cursor,
+                self.sql.insert_activities,
+                [activity.to_dict() for activity in activities],
+                template=self.schema_to_template(Activity.SCHEMA),
+                page_size=len(activities),
+                fetch=True,
+            )
+
+        logger.debug(f"{len(res)} activity⸱ies saved to the database")
+        return [row[0] for row in res]
 
-        logger.debug(f"Activity {activity.id} saved to the database")
+    def iter_activities_rows(
+        self,
+        user: User,
+        columns: Tuple = Activity.SCHEMA,
+        bbox: Optional[tuple[float, float, float, float]] = None,
+    ) -> Iterator[tuple]:
+        """Streams the activities rows from the table `activities`,
+        only selecting the given columns, in that order.\n
+        If a (min_latitude, min_longitude, max_latitude, max_longitude) bbox is given,
+        only the activities intersecting it are selected, through the GiST index.\n
+        The rows are fetched by batches of itersize through a server-side cursor,
+        so that the whole history is never loaded in memory"""
+        if unknown_columns := set(columns) - set(Activity.SCHEMA):
+            raise ValueError(f"Unknown activity column⸱s {unknown_columns}")
 
-    def get_activities_details(self, user: User) -> list[dict[str, Any]]:
-        """Gets the activities details from the table `activities`"""
-        with self.connection.cursor() as cursor:
-            cursor.execute(self.sql.get_activities, {"email": user.email})
+        logger.debug(f"Streaming activity⸱ies {columns} from {user.email}")
+        with self.cursor(name=f"activities_{uuid.uuid4().hex}") as cursor:
+            cursor.itersize = self.conf.POSTGRES["itersize"]
+            cursor.execute(
+                self.sql.get_activities.format(columns=", ".join(columns)),
+                {"email": user.email, "bbox": self.bbox_to_sql(bbox)},
+            )
+            yield from cursor
+
+    def get_activity_track(self, activity_id: str) -> Optional[str]:
+        """Gets the track of the activity from the table `activities`"""
+        with self.cursor() as cursor:
+            cursor.execute(self.sql.get_activity_track, {"id": activity_id})
+            res = cursor.fetchone()
+
+        logger.debug(f"Getting track of activity {activity_id}")
+        return res[0] if res else None
+
+    def get_activities_tracks(
+        self, user: User, ids: list[str]
+    ) -> dict[str, Optional[str]]:
+        """Gets the tracks of the given activities of the user
+        from the table `activities`"""
+        with self.cursor() as cursor:
+            cursor.execute(
+                self.sql.get_activities_tracks, {"email": user.email, "ids": ids}
+            )
             res = cursor.fetchall()
 
-        logger.debug(f"Getting activity⸱ies from {user.email}")
-        return [self.res_to_dict(row, Activity.SCHEMA) for row in res]
+        logger.debug(f"Getting tracks of {len(ids)} activity⸱ies")
+        return dict(res)
 
-    def delete_activities(self, ids: list):
-        """Deletes activities from the table `activities` given a list of ids"""
-        with self.connection.cursor() as cursor:
-            cursor.execute(self.sql.delete_activities, {"ids": self.tuple_to_sql(ids)})
-            self.connection.commit()
+    def get_activities_ids(
+        self, user: User, after: Optional[datetime] = None
+    ) -> list[str]:
+        """Gets the ids of the activities started after the given date, or all of them"""
+        with self.cursor() as cursor:
+            cursor.execute(
+                self.sql.get_activities_ids, {"email": user.email, "after": after}
+            )
+            res = cursor.fetchall()
+
+        logger.debug(f"Getting activity⸱ies ids from {user.email} after {after}")
+        return [row[0] for row in res]
+
+    def get_activities_stats(self, user: User) -> list[dict[str, Any]]:
+        """Gets the number of activities, the latest start date and the totals
+        of distance, duration and elevation of the user for each sport"""
+        with self.cursor() as cursor:
+            cursor.execute(self.sql.get_activities_stats, {"email": user.email})
+            res = cursor.fetchall()
+
+        logger.debug(f"Getting activity⸱ies stats from {user.email}")
+        schema = (
+            "sport",
+            "count",
+            "latest_start_date",
+            "distance",
+            "duration",
+            "elevation",
+        )
+        return [self.res_to_dict(row, schema) for row in res]
+
+    def get_sync_cursor(self, user: User) -> dict[str, Any]:
+        """Gets the number of activities and the latest start date of the user"""
+        with self.cursor() as cursor:
+            cursor.execute(self.sql.get_sync_cursor, {"email": user.email})
+            res = cursor.fetchone()
+
+        logger.debug(f"Getting sync cursor from {user.email}")
+        return self.res_to_dict(res, ("count", "latest_start_date"))
+
+    def get_unlocated_tracks(self, user: User) -> dict[str, str]:
+        """Gets the tracks of the activities of the user without bounding box"""
+        with self.cursor() as cursor:
+            cursor.execute(self.sql.get_unlocated_tracks, {"email": user.email})
+            res = cursor.fetchall()
+
+        logger.debug(f"Getting unlocated tracks from {user.email}")
+        return dict(res)
+
+    def update_locations(self, activities: list[Activity]):
+        """Updates the bounding box and start point of the activities"""
+        with self.cursor() as cursor:
+            psycopg2.extras.execute_values(
+                cursor,
+                self.sql.update_locations,
+                [
+                    (activity.id, activity.bbox, activity.start_point)
+                    for activity in activities
+                ],
+                page_size=len(activities),
+            )
+
+        logger.debug(f"Updating location of {len(activities)} activity⸱ies")
+
+    def delete_activities(self, user: User, ids: list):
+        """Deletes activities of the user from the table `activities`
+        given a list of ids"""
+        with self.cursor() as cursor:
+            cursor.execute(
+                self.sql.delete_activities, {"email": user.email, "ids": ids}
+            )
+
+        logger.debug(f"Deleting activity⸱ies {ids} from {user.email}")
+
+    # ========== HEXBINS ==========
+
+    def get_hexbins(self, user: User, resolution: int) -> list[tuple]:
+        """Gets the (q, r, counts, visits) hexagons of the user at the resolution
+        from the table `hexbins`"""
+        with self.cursor() as cursor:
+            cursor.execute(
+                self.sql.get_hexbins, {"email": user.email, "resolution": resolution}
+            )
+            res = cursor.fetchall()
+
+        logger.debug(f"Getting hexbins from {user.email} at {resolution}")
+        return res
+
+    def update_hexbins(self, user: User, hexbins: list[tuple], clear: bool = False):
+        """Adds the (resolution, q, r, counts, visits) hexagons to the ones of the user
+        in the table `hexbins`, negative values removing them.\n
+        If clear is True, the previous hexagons are deleted first"""
+        with self.cursor() as cursor:
+            if clear:
+                cursor.execute(self.sql.delete_hexbins, {"email": user.email})
+            psycopg2.extras.execute_values(
+                cursor,
+                self.sql.upsert_hexbins,
+                [(user.email, *hexbin) for hexbin in hexbins],
+                page_size=1000,
+            )
+            cursor.execute(self.sql.delete_empty_hexbins, {"email": user.email})
+
+        logger.debug(f"Updating {len(hexbins)} hexbin⸱s of {user.email}")
+
+    # ========== TRACKS ==========
+
+    def save_tracks(self, tracks: list[tuple]):
+        """Saves the (id, level, track) simplified tracks into the table `tracks`"""
+        with self.cursor() as cursor:
+            psycopg2.extras.execute_values(
+                cursor, self.sql.insert_tracks, tracks, page_size=1000
+            )
+
+        logger.debug(f"{len(tracks)} simplified track⸱s saved to the database")
+
+    def get_tracks(
+        self,
+        user: User,
+        level: int,
+        bbox: Optional[tuple[float, float, float, float]] = None,
+    ) -> dict[str, Optional[str]]:
+        """Gets the tracks of the user simplified at the level from the table `tracks`,
+        only the ones intersecting the bbox if given"""
+        with self.cursor() as cursor:
+            cursor.execute(
+                self.sql.get_tracks,
+                {"email": user.email, "level": level, "bbox": self.bbox_to_sql(bbox)},
+            )
+            res = cursor.fetchall()
+
+        logger.debug(f"Getting tracks from {user.email} at level {level}")
+        return dict(res)
+
+    def get_unsimplified_tracks(self, user: User) -> dict[str, Optional[str]]:
+        """Gets the full tracks of the activities of the user without simplified tracks"""
+        with self.cursor() as cursor:
+            cursor.execute(self.sql.get_unsimplified_tracks, {"email": user.email})
+            res = cursor.fetchall()
 
-        logger.debug(f"Deleting activity⸱ies {ids}")
+        logger.debug(f"Getting unsimplified tracks from {user.email}")
+        return dict(res)
@@ -0,0 +1,52 @@
+"""Module used to stream the progress of the tasks through Redis pub/sub"""
+
+import json
+import logging
+from typing import Any
+
+import redis
+
+from .confs import Conf
+
+logger = logging.getLogger(__name__)
+
+
+class Progress:
+    """Progress class to publish the states of the tasks to their listeners"""
+
+    def __init__(self, conf: Conf, redis_client: redis.Redis):
+        self.conf = conf
+        self.redis = redis_client
+        self.prefix = self.conf.REDIS["progress_prefix"]
+
+    def get_channel(self, task_id: str) -> str:
+        """Returns the Redis channel of the task"""
+        return f"{self.prefix}:{task_id}"
+
+    def publish(self, task_id: str, state: str, info: Any):
+        """Publishes the new state of the task and its info,
+        the info not json serializable being converted to strings"""
+        self.redis.publish(
+            self.get_channel(task_id),
+            json.dumps({"state": state, "info": info}, default=str),
+        )
+        logger.debug(f"Task {task_id} published as {state}")
+
+    def increment(self, task_id: str, amount: int = 1) -> int:
+        """Increments the progress counter of the task, shared by its subtasks,
+        and returns its new value"""
+        key = f"{self.prefix}:{task_id}:count"
+        pipeline = self.redis.pipeline()
+        pipeline.incrby(key, amount)
+        pipeline.expire(key, self.conf.PROGRESS["counter_ttl"])
+        return pipeline.execute()[0]
+
+    def reset(self, task_id: str):
+        """Resets the progress counter of the task"""
+        self.redis.delete(f"{self.prefix}:{task_id}:count")
+
+    def subscribe(self, task_id: str) -> redis.client.PubSub:
+        """Subscribes to the states of the task, to be closed once done"""
+        pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(self.get_channel(task_id))
+        return pubsub
@@ -0,0 +1,160 @@
+"""Module used to share the Strava API usage between the workers through Redis"""
+
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+import redis
+
+from .confs import Conf
+
+logger = logging.getLogger(__name__)
+
+# Keeps the highest known usage, the headers may be older than the reservations
+RECORD_USAGE_SCRIPT = """
+if tonumber(redis.call("GET", KEYS[1]) or 0) < tonumber(ARGV[1]) then
+    redis.call("SET", KEYS[1], ARGV[1], "EXAT", ARGV[2])
+end
+"""
+
+
+class RateLimiter:
+    """Rate Limiter class to track the API usage of every worker"""
+
+    # Names of the limits, in the order of the Strava headers
+    LIMITS = ("15min", "daily", "read_15min", "read_daily")
+    # Limits shared fairly between the users, the daily ones being too long
+    # to keep the share of the users done with their synchronization
+    FAIR_LIMITS = ("15min", "read_15min")
+
+    def __init__(self, conf: Conf, redis_client: redis.Redis):
+        self.conf = conf
+        self.redis = redis_client
+        self.prefix = self.conf.REDIS["rate_limiter_prefix"]
+        self.record_usage_script = self.redis.register_script(RECORD_USAGE_SCRIPT)
+
+    # ========== UTILS ==========
+
+    def get_window_end(self, limit: str, now: datetime) -> datetime:
+        """Returns the end of the current window of the limit,
+        the next 15 minutes interval or tomorrow 00:00 UTC"""
+        if limit.endswith("daily"):
+            return (now + timedelta(days=1)).replace(
+                hour=0, minute=0, second=0, microsecond=0
+            )
+        return now.replace(minute=0, second=0, microsecond=0) + timedelta(
+            minutes=(now.minute // 15 + 1) * 15
+        )
+
+    def get_key(self, limit: str, window_end: datetime) -> str:
+        """Returns the Redis key of the usage of the limit for the given window"""
+        return f"{self.prefix}:usage:{limit}:{int(window_end.timestamp())}"
+
+    def get_users_key(self, limit: str, window_end: datetime) -> str:
+        """Returns the Redis key of the usage of each user for the given window"""
+        return f"{self.get_key(limit, window_end)}:users"
+
+    # ========== USAGE ==========
+
+    def record_usage(self, limits: list[int], used: list[int]):
+        """Records the limits and the usage read from the API headers"""
+        now = datetime.now(timezone.utc)
+        with self.redis.pipeline() as pipeline:
+            pipeline.hset(
+                f"{self.prefix}:limits", mapping=dict(zip(self.LIMITS, limits))
+            )
+            for limit, usage in zip(self.LIMITS, used):
+                window_end = self.get_window_end(limit, now)
+                self.record_usage_script(
+                    keys=[self.get_key(limit, window_end)],
+                    args=[usage, int(window_end.timestamp())],
+                    client=pipeline,
+                )
+            pipeline.execute()
+
+    def reserve(self, email: Optional[str] = None) -> Optional[datetime]:
+        """Reserves a request in the shared usage,
+        returns the date to wait for if the spam limit is reached.\n
+        If the user is given, the share of the user is checked as well
+        by get_share_pause"""
+        now = datetime.now(timezone.utc)
+        window_ends = {limit: self.get_window_end(limit, now) for limit in self.LIMITS}
+        with self.redis.pipeline() as pipeline:
+            for limit, window_end in window_ends.items():
+                key = self.get_key(limit, window_end)
+                pipeline.incr(key)
+                pipeline.expireat(key, window_end)
+            pipeline.hgetall(f"{self.prefix}:limits")
+            if email:
+                for limit in self.FAIR_LIMITS:
+                    users_key = self.get_users_key(limit, window_ends[limit])
+                    pipeline.zincrby(users_key, 1, email)
+                    pipeline.expireat(users_key, window_ends[limit])
+                    pipeline.zcard(users_key)
+            res = pipeline.execute()
+        limits = res[2 * len(self.LIMITS)]
+
+        # Limits are unknown until the first response has been recorded
+        if not limits:
+            return None
+
+        windows = {
+            limit: (
+                window_ends[limit],
+                usage,
+                int(limits[limit.encode()]) * self.conf.STRAVA["spam_limit"],
+            )
+            for limit, usage in zip(self.LIMITS, res[: 2 * len(self.LIMITS) : 2])
+        }
+        if pause_until := max(
+            (end for end, usage, allowed in windows.values() if usage > allowed),
+            default=None,
+        ):
+            logger.info(
+                "API calls are put on hold for every worker until "
+                + pause_until.strftime("%d/%m/%Y %H:%M:%S UTC"),
+            )
+            return pause_until
+
+        if email:
+            return self.get_share_pause(email, windows, res[2 * len(self.LIMITS) + 1 :])
+        return None
+
+    def get_share_pause(
+        self,
+        email: str,
+        windows: dict[str, tuple[datetime, int, float]],
+        users_usages: list,
+    ) -> Optional[datetime]:
+        """Returns the date to wait for if the user exceeds its share of the API,
+        given the (window end, usage, allowed usage) of each limit
+        and the (usage of the user, _, active users) of each fair limit.\n
+        Once the usage of a 15 minutes window exceeds
+        SCHEDULER["fair_share_threshold"] of the spam limit, the user is put on hold
+        above an equal share of it between the users active in the window"""
+        pause_until = None
+        for i, limit in enumerate(self.FAIR_LIMITS):
+            window_end, usage, allowed = windows[limit]
+            user_usage, active_users = users_usages[3 * i], users_usages[3 * i + 2]
+            if (
+                usage > allowed * self.conf.SCHEDULER["fair_share_threshold"]
+                and user_usage > allowed / active_users
+            ):
+                pause_until = max(pause_until or window_end, window_end)
+
+        if pause_until:
+            logger.info(
+                f"API calls of {email} are put on hold until "
+                + pause_until.strftime("%d/%m/%Y %H:%M:%S UTC")
+                + " to share the quota with the other users",
+            )
+        return pause_until
+
+    def get_users_usages(self) -> dict[str, int]:
+        """Returns the requests of each user in the current 15 minutes window"""
+        now = datetime.now(timezone.utc)
+        users_key = self.get_users_key("15min", self.get_window_end("15min", now))
+        return {
+            email.decode(): int(usage)
+            for email, usage in self.redis.zrange(users_key, 0, -1, withscores=True)
+        }
@@ -1,18 +1,26 @@
 """Module used to define the Flask routes"""
 
+import gzip
+import json
 import logging
+import time
 import urllib
 from datetime import datetime
-from typing import cast
+from typing import Optional, cast
 
+import brotli
 import flask
 import flask_login
+import numpy as np
 from celery import Celery
 from celery.app.task import Task
 
+from . import hexbin
 from .activities_manager import ActivitiesManager
 from .assets import User
 from .confs import Conf
+from .progress import Progress
+from .sync_scheduler import SyncScheduler
 from .users_manager import UsersManager
 
 logger = logging.getLogger(__name__)
@@ -132,6 +140,10 @@ class Routes:
                 "strava_expires_date": flask.session["strava_expires_date"],
                 "strava_refresh_token": flask.session["strava_refresh_token"],
                 "import_task_id": None,
+                "last_full_sync": None,
+                "data_version": 0,
+                # A new user has no activities, their hexagons are built as imported
+                "hexbins_built": True,
             }
             if user := self.users_manager.create_user(user_details):
                 logger.debug(
@@ -163,7 +175,7 @@ class Routes:
     def home(self):
         """GET returns /home if he's logged in"""
         logger.debug(f"Rendering /home for {current_user.email}")
-        activities = self.activities_manager.get_activities(current_user)
+        stats = self.activities_manager.get_activities_stats(current_user)
 
         if task_id := current_user.import_task_id:
             task = self.celery_app.AsyncResult(task_id)
@@ -177,56 +189,314 @@ class Routes:
             firstname=current_user.firstname,
             lastname=current_user.lastname,
             profile_picture_url=current_user.profile_picture_url,
-            number_of_activities=len(activities),
-            last_import=max(activity.start_date for activity in activities).strftime(
-                "%Y/%m/%d - %H:%M"
+            number_of_activities=stats["count"],
+            last_import=(
+                stats["latest_start_date"].strftime("%Y/%m/%d - %H:%M")
+                if stats["latest_start_date"]
+                else "Never"
             ),
+            sports=stats["sports"],
             task_id=task_id,
         )
 
-    def synchronize_activities(self, process: Task):
-        """PUT synchronizes the activites of the user from Strava"""
+    def synchronize_activities(self, process: Task, sync_scheduler: SyncScheduler):
+        """PUT synchronizes the activites of the user from Strava,
+        queued with the priority given by the scheduler"""
         if task_id := current_user.import_task_id:
             task = self.celery_app.AsyncResult(task_id)
-            if task.state not in ["PENDING", "FAILURE", "SUCCESS"]:
+            # The state of the task of a killed worker stays the same until its
+            # redelivery, so the task is replaced once its lease has expired
+            running = task.state not in ["PENDING", "FAILURE", "SUCCESS"]
+            if running and self.activities_manager.is_synchronizing(current_user):
                 logger.info(f"Synchronize activity⸱ies : Task {task_id} found")
                 return task_id
             logger.debug(f"Revoking task {task_id}")
             task.revoke()
 
-        task_id = process.delay(current_user.to_dict()).id
+        # The first and the periodic full synchronizations are the bulk ones
+        full_sync = self.activities_manager.get_sync_after(current_user) is None
+        task_id = process.apply_async(
+            (current_user.to_dict(),),
+            priority=sync_scheduler.get_sync_priority(full_sync),
+        ).id
         logger.info(f"Synchronize activity⸱ies : Task {task_id} created")
         self.users_manager.update_user(current_user, {"import_task_id": task_id})
         return task_id
 
-    def task_status(self, task_id: str):
-        """GET the status of the provided task_id"""
-        task = self.celery_app.AsyncResult(task_id)
-        match task.state:
-            case "PENDING" | "RETRY":
+    def strava_webhook(self, process: Task):
+        """GET validates the Strava push subscription\n
+        POST queues the events of the activities of the subscription,
+        Strava expecting an answer within 2 seconds"""
+        if flask.request.method == "GET":
+            if (
+                flask.request.args.get("hub.mode") != "subscribe"
+                or flask.request.args.get("hub.verify_token")
+                != self.conf.STRAVA["webhook"]["verify_token"]
+            ):
+                logger.warning("Strava subscription refused")
+                flask.abort(403)
+            logger.info("Strava subscription validated")
+            return flask.jsonify(
+                {"hub.challenge": flask.request.args.get("hub.challenge")}
+            )
+
+        event = flask.request.get_json(silent=True)
+        try:
+            object_type, aspect_type = event["object_type"], event["aspect_type"]
+            owner_id, object_id = str(event["owner_id"]), str(event["object_id"])
+            subscription_id = str(event["subscription_id"])
+        except (KeyError, TypeError):
+            flask.abort(400)
+
+        if subscription_id != self.conf.STRAVA["webhook"]["subscription_id"]:
+            logger.warning(f"Strava event of subscription {subscription_id} refused")
+            flask.abort(403)
+
+        if object_type == "activity" and aspect_type in ["create", "update", "delete"]:
+            task_id = process.delay(
+                owner_id, object_id, aspect_type, event.get("updates") or {}
+            ).id
+            logger.info(f"Strava event {aspect_type} {object_id} : Task {task_id}")
+        else:
+            logger.debug(f"Strava event {object_type} {aspect_type} ignored")
+        return flask.jsonify({})
+
+    def get_task_status(self, state: str, info) -> dict:
+        """Converts the state and the info of a task into its status"""
+        match state:
+            case "PENDING":
                 res = {
-                    "state": task.state,
+                    "state": state,
                     "status": "Waiting for the task",
                 }
+            case "RETRY":
+                # The task, or one of its chunks, has been rescheduled until the API
+                # quota is available or after an API error, info being the exception
+                res = {
+                    "state": state,
+                    "status": str(info),
+                }
             case "STARTED" | "PROGRESS":
+                info = info or {}
                 res = {
-                    "state": task.state,
-                    "status": task.info.get("status", "Synchronization is starting"),
-                    "current": task.info.get("current", 0),
-                    "total": task.info.get("total", 1),
+                    "state": state,
+                    "status": info.get("status", "Synchronization is starting"),
+                    "current": info.get("current", 0),
+                    "total": info.get("total", 1),
                 }
             case "SUCCESS":
                 res = {
-                    "state": task.state,
-                    "new_activities": task.info["new_activities"],
-                    "total_activities": task.info["total_activities"],
+                    "state": state,
+                    "new_activities": info["new_activities"],
+                    "total_activities": info["total_activities"],
                 }
-            case "FAILURE":
+            case _:
                 res = {
-                    "state": task.state,
-                    "status": str(task.info),
+                    "state": state,
+                    "status": str(info),
                 }
-        return flask.jsonify(res)
+        return res
+
+    def task_status(self, task_id: str):
+        """GET the status of the provided task_id"""
+        task = self.celery_app.AsyncResult(task_id)
+        return flask.jsonify(self.get_task_status(task.state, task.info))
+
+    def task_progress(self, task_id: str, progress: Progress):
+        """GET the Server-Sent Events stream of the status of the provided task_id,
+        sent on each change until the task succeeds or fails"""
+        # Subscribes before reading the current state so no change is missed
+        pubsub = progress.subscribe(task_id)
+        task = self.celery_app.AsyncResult(task_id)
+        status = self.get_task_status(task.state, task.info)
+
+        def stream(status: dict):
+            try:
+                yield f"data: {json.dumps(status)}\n\n"
+                end = time.monotonic() + self.conf.PROGRESS["max_stream_duration"]
+                while (
+                    status["state"] not in ["SUCCESS", "FAILURE"]
+                    and time.monotonic() < end
+                ):
+                    if not (
+                        message := pubsub.get_message(
+                            timeout=self.conf.PROGRESS["keepalive_interval"]
+                        )
+                    ):
+                        yield ": keepalive\n\n"
+                        continue
+                    update = json.loads(message["data"])
+                    status = self.get_task_status(update["state"], update["info"])
+                    yield f"data: {json.dumps(status)}\n\n"
+            finally:
+                pubsub.close()
+
+        logger.debug(f"Streaming the progress of task {task_id}")
+        return flask.Response(
+            stream(status),
+            mimetype="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
+    def sync_metrics(self, sync_scheduler: SyncScheduler):
+        """GET the depth and the wait times of the synchronization queues"""
+        return flask.jsonify(sync_scheduler.get_metrics())
+
+    def get_bbox_arg(self) -> Optional[tuple[float, float, float, float]]:
+        """Parses the optional bbox=min_lat,min_lng,max_lat,max_lng arg,
+        raises ValueError if it is malformed"""
+        if not (bbox_arg := flask.request.args.get("bbox")):
+            return None
+        if len(bbox := tuple(map(float, bbox_arg.split(",")))) != 4:
+            raise ValueError(f"Malformed bbox {bbox_arg}")
+        return bbox
+
+    def hexbins(self):
+        """GET the hexagons crossed by the activities of the user,
+        with the optional args resolution, bbox=min_lat,min_lng,max_lat,max_lng
+        and format=json or binary.\n
+        The binary format is the little-endian int32 columns q, r, counts and visits,
+        one after the other"""
+        try:
+            resolution = int(
+                flask.request.args.get(
+                    "resolution", self.conf.HEXBIN["default_resolution"]
+                )
+            )
+            bbox = self.get_bbox_arg()
+        except ValueError:
+            flask.abort(400)
+        output_format = flask.request.args.get("format", "json")
+        if not 0 <= resolution <= self.conf.HEXBIN["max_resolution"]:
+            flask.abort(400)
+        if output_format not in ["json", "binary"]:
+            flask.abort(400)
+
+        logger.debug(f"Binning activity⸱ies of {current_user.email} at {resolution}")
+        hexbins = self.activities_manager.get_hexbins(current_user, resolution, bbox)
+        size = hexbin.get_hex_size(self.conf.HEXBIN["base_size"], resolution)
+
+        if output_format == "binary":
+            res = flask.make_response(
+                np.concatenate(
+                    [hexbins[column] for column in ["q", "r", "counts", "visits"]]
+                )
+                .astype("<i4")
+                .tobytes()
+            )
+            res.mimetype = "application/octet-stream"
+            res.headers["X-Hex-Size"] = str(size)
+            return res
+
+        return flask.jsonify(
+            {"resolution": resolution, "size": size}
+            | {column: values.tolist() for column, values in hexbins.items()}
+        )
+
+    def tracks(self):
+        """GET the encoded tracks of the activities of the user {id: track},
+        simplified according to the zoom arg of the map,
+        and only the ones in the optional bbox=min_lat,min_lng,max_lat,max_lng"""
+        try:
+            zoom = float(flask.request.args["zoom"])
+            bbox = self.get_bbox_arg()
+        except (KeyError, ValueError):
+            flask.abort(400)
+
+        logger.debug(f"Getting tracks of {current_user.email} at zoom {zoom}")
+        return flask.jsonify(
+            self.activities_manager.get_tracks(current_user, zoom, bbox)
+        )
+
+    def heatmap(self, z: int, x: int, y: int):
+        """GET the PNG heatmap tile z/x/y of the activities of the user"""
+        if not 0 <= z <= self.conf.TILES["max_zoom"] or not (
+            0 <= x < 2**z and 0 <= y < 2**z
+        ):
+            flask.abort(400)
+
+        # The tile only changes with the activities, the browser revalidates it
+        # with the version of the data before it is rendered
+        etag = self.activities_manager.get_data_etag(current_user)
+        if flask.request.if_none_match.contains(etag):
+            return flask.Response(status=304)
+
+        logger.debug(f"Getting heatmap tile {z}/{x}/{y} of {current_user.email}")
+        res = flask.make_response(
+            self.activities_manager.get_heatmap_tile(current_user, z, x, y)
+        )
+        res.mimetype = "image/png"
+        res.headers["Cache-Control"] = "private, no-cache"
+        res.set_etag(etag)
+        return res
+
+    def height_map(self, resolution: int, q: int, r: int):
+        """GET the PNG height map of the roof of the hexagon (q, r) at the resolution,
+        following the visits of the activities of the user"""
+        if not 0 <= resolution <= self.conf.HEXBIN["max_resolution"]:
+            flask.abort(400)
+
+        etag = self.activities_manager.get_data_etag(current_user)
+        if flask.request.if_none_match.contains(etag):
+            return flask.Response(status=304)
+
+        logger.debug(f"Getting height map {resolution}/{q}/{r} of {current_user.email}")
+        res = flask.make_response(
+            self.activities_manager.get_height_map(current_user, resolution, q, r)
+        )
+        res.mimetype = "image/png"
+        res.headers["Cache-Control"] = "private, no-cache"
+        res.set_etag(etag)
+        return res
+
+    def geometry(self):
+        """GET the tracks of the activities of the user as the binary columns
+        described in geometry.encode_geometry, simplified according to the optional
+        zoom arg, compressed with brotli or gzip if accepted by the client.\n
+        The names of the sports and the number of activities and points are given
+        in the headers X-Sports, X-Activities and X-Points"""
+        try:
+            zoom = (
+                float(flask.request.args["zoom"])
+                if "zoom" in flask.request.args
+                else None
+            )
+        except ValueError:
+            flask.abort(400)
+
+        encoding = flask.request.accept_encodings.best_match(["br", "gzip"])
+        # Each encoding is a different representation, hence a different ETag
+        etag = (
+            f"{self.activities_manager.get_data_etag(current_user)}"
+            + f"-{encoding or 'identity'}"
+        )
+        if flask.request.if_none_match.contains(etag):
+            return flask.Response(status=304)
+
+        logger.debug(f"Getting geometry of {current_user.email} at zoom {zoom}")
+        geometry = self.activities_manager.get_geometry(current_user, zoom)
+
+        match encoding:
+            case "br":
+                res = flask.make_response(
+                    brotli.compress(geometry["geometry"], quality=5)
+                )
+            case "gzip":
+                res = flask.make_response(
+                    gzip.compress(geometry["geometry"], compresslevel=6)
+                )
+            case _:
+                res = flask.make_response(geometry["geometry"])
+        if encoding:
+            res.headers["Content-Encoding"] = encoding
+        res.mimetype = "application/octet-stream"
+        res.headers["X-Sports"] = json.dumps(geometry["sports"])
+        res.headers["X-Activities"] = str(geometry["activities"])
+        res.headers["X-Points"] = str(geometry["points"])
+        res.headers["Cache-Control"] = "private, no-cache"
+        res.headers["Vary"] = "Accept-Encoding"
+        res.set_etag(etag)
+        return res
 
     def map(self):
         """GET returns /map"""
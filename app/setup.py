@@ -7,6 +7,7 @@ import os
 
 import flask
 import flask_login
+import redis
 from argon2 import PasswordHasher
 from celery import Celery
 from dotenv import load_dotenv
@@ -15,8 +16,13 @@ from flask_cors import CORS
 from .activities_manager import ActivitiesManager
 from .confs import SQL, Conf
 from .postgres import Postgres
+from .progress import Progress
+from .rate_limiter import RateLimiter
 from .routes import Routes
 from .strava import Strava
+from .sync_checkpoint import SyncCheckpoint
+from .sync_scheduler import SyncScheduler
+from .user_cache import UserCache
 from .users_manager import UsersManager
 
 # ========== Logging &  Conf ==========
@@ -30,12 +36,18 @@ CONF = Conf()
 
 logger.debug("Creating users & activities managers")
 sql = SQL()
-postgres = Postgres(CONF, sql)
-strava = Strava(CONF, postgres)
+redis_client = redis.Redis.from_url(CONF.REDIS["broker_url"])
+user_cache = UserCache(CONF, redis_client)
+postgres = Postgres(CONF, sql, user_cache)
+rate_limiter = RateLimiter(CONF, redis_client)
+progress = Progress(CONF, redis_client)
+sync_checkpoint = SyncCheckpoint(CONF, redis_client)
+sync_scheduler = SyncScheduler(CONF, redis_client, rate_limiter)
+strava = Strava(CONF, postgres, rate_limiter)
 
 password_hasher = PasswordHasher()
-users_manager = UsersManager(postgres, password_hasher)
-activities_manager = ActivitiesManager(postgres, strava)
+users_manager = UsersManager(postgres, password_hasher, user_cache)
+activities_manager = ActivitiesManager(CONF, postgres, strava, sync_checkpoint)
 
 # ========== Celery App ==========
 
@@ -45,6 +57,13 @@ celery_app = Celery(
     broker=CONF.REDIS["broker_url"],
     backend=CONF.REDIS["result_backend_url"],
 )
+celery_app.conf.update(
+    task_default_queue=CONF.SCHEDULER["sync_queue"],
+    broker_transport_options=sync_scheduler.get_transport_options()
+    | {"visibility_timeout": CONF.REDIS["visibility_timeout"]},
+    # The tasks are not reserved in advance, so the priorities apply to each one
+    worker_prefetch_multiplier=1,
+)
 
 # ========== Flask App ==========
 
@@ -0,0 +1,81 @@
+"""Module used to simplify the tracks into several levels of detail"""
+
+from typing import Optional
+
+import numpy as np
+
+from . import hexbin, polyline
+
+# Meters per pixel at zoom 0 of the Web Mercator tiles, at the equator
+METERS_PER_PIXEL = 2 * np.pi * hexbin.EARTH_RADIUS / 256
+
+
+def get_distances(points: np.ndarray, first: int, last: int) -> np.ndarray:
+    """Returns the distances of the points between first and last
+    to the segment [first, last]"""
+    start, end = points[first], points[last]
+    direction = end - start
+    length = np.hypot(*direction)
+    inner = points[first + 1 : last] - start
+    if length:
+        return np.abs(direction[0] * inner[:, 1] - direction[1] * inner[:, 0]) / length
+    return np.hypot(inner[:, 0], inner[:, 1])
+
+
+def get_importances(points: np.ndarray, min_tolerance: float) -> np.ndarray:
+    """Runs Douglas-Peucker once on the projected points and returns for each point
+    the largest tolerance keeping it, so that every level of detail is a threshold.\n
+    The recursion stops below min_tolerance, the points left have an importance of 0"""
+    importances = np.zeros(len(points))
+    if len(points) < 3:
+        importances[:] = np.inf
+        return importances
+    importances[[0, -1]] = np.inf
+
+    # Each segment inherits the importance of its parent split, a point being kept
+    # only if every split above it is kept as well
+    segments = [(0, len(points) - 1, np.inf)]
+    while segments:
+        first, last, parent_importance = segments.pop()
+        if last - first < 2:
+            continue
+
+        distances = get_distances(points, first, last)
+        farthest = int(np.argmax(distances))
+        if (distance := distances[farthest]) <= min_tolerance:
+            continue
+
+        split = first + 1 + farthest
+        importances[split] = min(distance, parent_importance)
+        segments.append((first, split, importances[split]))
+        segments.append((split, last, importances[split]))
+
+    return importances
+
+
+def simplify(track: Optional[str], tolerances: list[float]) -> list[str]:
+    """Simplifies the encoded track at each tolerance, in meters,
+    and returns the encoded simplified tracks"""
+    coords = polyline.decode(track)
+    if coords.size == 0:
+        return ["" for _ in tolerances]
+
+    # Web Mercator stretches the distances by 1 / cos(latitude)
+    scale = 1 / np.cos(np.radians(np.mean(coords[:, 0])))
+    importances = get_importances(hexbin.project(coords), min(tolerances) * scale)
+    return [
+        polyline.encode(coords[importances > tolerance * scale])
+        for tolerance in tolerances
+    ]
+
+
+def get_level(zoom: float, tolerances: list[float]) -> Optional[int]:
+    """Returns the coarsest level of detail whose tolerance stays under a pixel
+    at the given zoom, or None if the full track is needed"""
+    meters_per_pixel = METERS_PER_PIXEL / 2**zoom
+    levels = [
+        level
+        for level, tolerance in enumerate(tolerances)
+        if tolerance <= meters_per_pixel
+    ]
+    return max(levels, key=lambda level: tolerances[level]) if levels else None
@@ -11,5 +11,11 @@ CREATE TABLE
         duration interval,
         speed float,
         elevation float,
+        bbox box,
+        start_point point,
         CONSTRAINT activities_pk PRIMARY KEY (id)
-    );
\ No newline at end of file
+    );
+
+CREATE INDEX activities_email_idx ON activities (email, start_date);
+
+CREATE INDEX activities_bbox_idx ON activities USING gist (bbox);
\ No newline at end of file
@@ -1,5 +1,4 @@
 DELETE FROM activities
-WHERE id
-IN (
-    %(ids)s
-)
\ No newline at end of file
+WHERE
+    email = %(email)s
+    AND id = ANY(%(ids)s)
\ No newline at end of file
@@ -1,16 +1,10 @@
 SELECT
-    email,
-    id,
-    sport,
-    name,
-    description,
-    track,
-    start_date,
-    distance,
-    duration,
-    speed,
-    elevation
+    {columns}
 FROM
     activities
 WHERE
-    email = %(email)s
\ No newline at end of file
+    email = %(email)s
+    AND (
+        %(bbox)s IS NULL
+        OR bbox && %(bbox)s::box
+    )
\ No newline at end of file
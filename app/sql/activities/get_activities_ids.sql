@@ -0,0 +1,10 @@
+SELECT
+    id
+FROM
+    activities
+WHERE
+    email = %(email)s
+    AND (
+        %(after)s IS NULL
+        OR start_date >= %(after)s
+    )
\ No newline at end of file
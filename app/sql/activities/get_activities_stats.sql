@@ -0,0 +1,15 @@
+SELECT
+    sport,
+    count(id),
+    max(start_date),
+    sum(distance),
+    sum(duration),
+    sum(elevation)
+FROM
+    activities
+WHERE
+    email = %(email)s
+GROUP BY
+    sport
+ORDER BY
+    count(id) DESC
\ No newline at end of file
@@ -0,0 +1,8 @@
+SELECT
+    id,
+    track
+FROM
+    activities
+WHERE
+    email = %(email)s
+    AND id = ANY(%(ids)s)
\ No newline at end of file
@@ -0,0 +1,8 @@
+SELECT
+    track
+FROM
+    activities
+WHERE
+    id = %(id)s
+LIMIT
+    1
\ No newline at end of file
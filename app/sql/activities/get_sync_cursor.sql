@@ -0,0 +1,7 @@
+SELECT
+    count(id),
+    max(start_date)
+FROM
+    activities
+WHERE
+    email = %(email)s
\ No newline at end of file
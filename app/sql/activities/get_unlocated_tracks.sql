@@ -0,0 +1,9 @@
+SELECT
+    id,
+    track
+FROM
+    activities
+WHERE
+    email = %(email)s
+    AND bbox IS NULL
+    AND track <> ''
\ No newline at end of file
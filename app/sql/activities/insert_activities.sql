@@ -0,0 +1,21 @@
+INSERT INTO
+    activities (
+        email,
+        id,
+        sport,
+        name,
+        description,
+        track,
+        start_date,
+        distance,
+        duration,
+        speed,
+        elevation,
+        bbox,
+        start_point
+    )
+VALUES
+    %s
+ON CONFLICT (id) DO NOTHING
+RETURNING
+    id
\ No newline at end of file
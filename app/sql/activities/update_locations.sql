@@ -0,0 +1,11 @@
+UPDATE activities
+SET
+    bbox = locations.bbox::box,
+    start_point = locations.start_point::point
+FROM
+    (
+        VALUES
+            %s
+    ) AS locations (id, bbox, start_point)
+WHERE
+    activities.id = locations.id
\ No newline at end of file
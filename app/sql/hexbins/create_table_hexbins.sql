@@ -0,0 +1,10 @@
+CREATE TABLE
+    hexbins (
+        email varchar NOT NULL,
+        resolution integer NOT NULL,
+        q integer NOT NULL,
+        r integer NOT NULL,
+        counts integer NOT NULL,
+        visits integer NOT NULL,
+        CONSTRAINT hexbins_pk PRIMARY KEY (email, resolution, q, r)
+    );
\ No newline at end of file
@@ -0,0 +1,4 @@
+DELETE FROM hexbins
+WHERE
+    email = %(email)s
+    AND counts <= 0
\ No newline at end of file
@@ -0,0 +1,3 @@
+DELETE FROM hexbins
+WHERE
+    email = %(email)s
\ No newline at end of file
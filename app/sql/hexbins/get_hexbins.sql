@@ -0,0 +1,10 @@
+SELECT
+    q,
+    r,
+    counts,
+    visits
+FROM
+    hexbins
+WHERE
+    email = %(email)s
+    AND resolution = %(resolution)s
\ No newline at end of file
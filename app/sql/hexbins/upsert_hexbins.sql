@@ -0,0 +1,15 @@
+INSERT INTO
+    hexbins (
+        email,
+        resolution,
+        q,
+        r,
+        counts,
+        visits
+    )
+VALUES
+    %s
+ON CONFLICT (email, resolution, q, r) DO UPDATE
+SET
+    counts = hexbins.counts + EXCLUDED.counts,
+    visits = hexbins.visits + EXCLUDED.visits
\ No newline at end of file
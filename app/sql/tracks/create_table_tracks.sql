@@ -0,0 +1,8 @@
+CREATE TABLE
+    tracks (
+        id varchar NOT NULL,
+        level integer NOT NULL,
+        track text,
+        CONSTRAINT tracks_pk PRIMARY KEY (id, level),
+        CONSTRAINT tracks_activities_fk FOREIGN KEY (id) REFERENCES activities (id) ON DELETE CASCADE
+    );
\ No newline at end of file
@@ -0,0 +1,13 @@
+SELECT
+    activities.id,
+    tracks.track
+FROM
+    tracks
+    JOIN activities ON activities.id = tracks.id
+WHERE
+    activities.email = %(email)s
+    AND tracks.level = %(level)s
+    AND (
+        %(bbox)s IS NULL
+        OR activities.bbox && %(bbox)s::box
+    )
\ No newline at end of file
@@ -0,0 +1,9 @@
+SELECT
+    activities.id,
+    activities.track
+FROM
+    activities
+    LEFT JOIN tracks ON tracks.id = activities.id
+WHERE
+    activities.email = %(email)s
+    AND tracks.id IS NULL
\ No newline at end of file
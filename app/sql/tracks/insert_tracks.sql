@@ -0,0 +1,9 @@
+INSERT INTO
+    tracks (
+        id,
+        level,
+        track
+    )
+VALUES
+    %s
+ON CONFLICT (id, level) DO NOTHING
\ No newline at end of file
@@ -10,5 +10,10 @@ CREATE TABLE
         strava_expires_date timestamp,
         strava_refresh_token varchar,
         import_task_id varchar,
+        last_full_sync timestamp,
+        data_version integer NOT NULL DEFAULT 0,
+        hexbins_built boolean NOT NULL DEFAULT false,
         CONSTRAINT users_pk PRIMARY KEY (email)
-    );
\ No newline at end of file
+    );
+
+CREATE INDEX users_strava_user_id_idx ON users (strava_user_id);
\ No newline at end of file
@@ -8,7 +8,10 @@ SELECT
     strava_access_token,
     strava_expires_date,
     strava_refresh_token,
-    import_task_id
+    import_task_id,
+    last_full_sync,
+    data_version,
+    hexbins_built
 FROM
     users
 WHERE
@@ -0,0 +1,20 @@
+SELECT
+    email,
+    password,
+    firstname,
+    lastname,
+    strava_user_id,
+    profile_picture_url,
+    strava_access_token,
+    strava_expires_date,
+    strava_refresh_token,
+    import_task_id,
+    last_full_sync,
+    data_version,
+    hexbins_built
+FROM
+    users
+WHERE
+    strava_user_id = %(strava_user_id)s
+LIMIT
+    1
\ No newline at end of file
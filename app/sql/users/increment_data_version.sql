@@ -0,0 +1,5 @@
+UPDATE users
+SET
+    data_version = data_version + 1
+WHERE email = %(email)s
+RETURNING data_version
\ No newline at end of file
@@ -9,7 +9,10 @@ INSERT INTO
         strava_access_token,
         strava_expires_date,
         strava_refresh_token,
-        import_task_id
+        import_task_id,
+        last_full_sync,
+        data_version,
+        hexbins_built
     )
 VALUES
     (
@@ -22,6 +25,9 @@ VALUES
         %(strava_access_token)s,
         %(strava_expires_date)s,
         %(strava_refresh_token)s,
-        %(import_task_id)s
+        %(import_task_id)s,
+        %(last_full_sync)s,
+        %(data_version)s,
+        %(hexbins_built)s
     )
 ON CONFLICT (email) DO NOTHING
\ No newline at end of file
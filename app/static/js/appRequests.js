@@ -27,3 +27,47 @@ export function getTaskStatusAPI(taskId, func) {
         },
     });
 }
+
+/**
+ * Streams the status of the provided task, sent by the server on each change
+ * @param {string} taskId ID of the task
+ * @param {function} func Function to call on each status
+ * @returns {EventSource} Stream to close once the task is over
+ */
+export function streamTaskStatusAPI(taskId, func) {
+    const eventSource = new EventSource(
+        `http://localhost:5000/task_progress/${taskId}`,
+        { withCredentials: true }
+    );
+    eventSource.addEventListener("message", (event) => {
+        func(JSON.parse(event.data));
+    });
+    return eventSource;
+}
+
+/**
+ * Gets the hexagons crossed by the activities of the user
+ * @param {number} resolution Resolution of the hexagons
+ * @param {function} func Function to call on success
+ */
+export function getHexbinsAPI(resolution, func) {
+    $.ajax({
+        type: "GET",
+        url: `http://localhost:5000/hexbins?resolution=${resolution}`,
+        xhrFields: { withCredentials: true },
+        success: (res) => {
+            func(res);
+        },
+    });
+}
+
+/**
+ * Returns the URL of the height map of the roof of a hexagon
+ * @param {number} resolution Resolution of the hexagon
+ * @param {number} q Axial column of the hexagon
+ * @param {number} r Axial row of the hexagon
+ * @returns {string} URL of the PNG height map
+ */
+export function getHeightMapUrl(resolution, q, r) {
+    return `http://localhost:5000/height_maps/${resolution}/${q}/${r}.png`;
+}
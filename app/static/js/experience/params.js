@@ -12,5 +12,7 @@ export const params = {
         size: 1,
         height: 1,
         division: 4,
+        displacementScale: 0.2,
+        resolution: 8,
     },
 };
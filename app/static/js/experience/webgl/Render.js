@@ -1,6 +1,8 @@
 import * as THREE from "three";
 import { MapControls } from "three/examples/jsm/controls/MapControls.js";
 
+import { getHeightMapUrl, getHexbinsAPI } from "../../appRequests";
+import { params } from "../params";
 import Tile from "./object/Tile";
 import RenderPass from "./pass/RenderPass";
 import Camera from "./setup/Camera";
@@ -39,9 +41,11 @@ export default class Render {
             pointLightHelper3 = new THREE.PointLightHelper(pointLight3, 1);
         this.scene.add(pointLightHelper1, pointLightHelper2, pointLightHelper3);
 
-        const tile = new Tile();
         const axisHelper = new THREE.AxesHelper(3);
-        this.scene.add(tile, axisHelper);
+        this.scene.add(axisHelper);
+        getHexbinsAPI(params.tile.resolution, (hexbins) =>
+            this.createTile(hexbins)
+        );
 
         this.renderer = new Renderer(this.canvaSize, this.container);
         this.composer = new Composer(this.canvaSize, this.renderer);
@@ -51,6 +55,24 @@ export default class Render {
         this.createListener();
     }
 
+    /**
+     * Creates the tile of the most visited hexagon, its roof displaced by the
+     * height map of the visits
+     * @param {object} hexbins Hexagons of the user, as returned by /hexbins
+     */
+    createTile(hexbins) {
+        const index = hexbins.visits.indexOf(Math.max(...hexbins.visits));
+        const heightMapUrl =
+            index === -1
+                ? null
+                : getHeightMapUrl(
+                      hexbins.resolution,
+                      hexbins.q[index],
+                      hexbins.r[index]
+                  );
+        this.scene.add(new Tile(heightMapUrl));
+    }
+
     /** Creates the listeners to update the render */
     createListener() {
         window.addEventListener("resize", () => {
@@ -6,10 +6,11 @@ import { computeUVs, subdiviseFaces, verticesToPositions } from "./utils";
 export default class Tile extends THREE.Mesh {
     /**
      * Creates the tile
+     * @param {string} heightMapUrl Optional URL of the height map of the roof, served by /height_maps
      */
-    constructor() {
+    constructor(heightMapUrl = null) {
         const geometry = new TileGeometry();
-        const material = new TileMaterial();
+        const material = new TileMaterial(heightMapUrl);
         super(geometry, material);
     }
 }
@@ -140,22 +141,28 @@ class TileGeometry extends THREE.BufferGeometry {
 class TileMaterial extends THREE.MeshStandardMaterial {
     /**
      * Creates the material
+     * @param {string} heightMapUrl Optional URL of the height map of the roof
      */
-    constructor() {
+    constructor(heightMapUrl = null) {
         const image = new Image();
         const texture = new THREE.Texture(image);
         image.addEventListener("load", () => {
             texture.needsUpdate = true;
         });
-        // image.src = "/app/static/img/height_map.jpg";
         image.src = "/app/static/img/uv_test.jpg";
         super({
             color: "#ffffff",
             roughness: 0.4,
             // wireframe: true,
             map: texture,
-            // displacementMap: texture,
-            // displacementScale: 0.2,
         });
+
+        if (heightMapUrl) {
+            // The height map is rendered by the server from the visits of the roof
+            this.displacementMap = new THREE.TextureLoader()
+                .setCrossOrigin("use-credentials")
+                .load(heightMapUrl);
+            this.displacementScale = params.tile.displacementScale;
+        }
     }
 }
@@ -1,10 +1,10 @@
-import { synchronizeActivitiesAPI, getTaskStatusAPI } from "./appRequests.js";
+import { synchronizeActivitiesAPI, streamTaskStatusAPI } from "./appRequests.js";
 
 const synchronizeActivitiesButton = document.getElementById(
     "synchronize-activities"
 );
 const totalActivities = document.getElementById("total-activities");
-let intervalSynchronizeActivitiesAPI = null;
+let streamSynchronizeActivitiesAPI = null;
 
 makeButtonSynchronizeActivitiesAPI();
 
@@ -27,13 +27,14 @@ function callSynchronizeActivitiesAPI() {
 }
 
 /**
- * Calls the API to get updates from the task
+ * Listens to the updates of the task
  */
 export function onSuccessSynchronizeActivitiesAPI(taskId) {
     lockButton();
-    intervalSynchronizeActivitiesAPI = setInterval(() => {
-        getTaskStatusAPI(taskId, onSuccessGetTaskStatusAPI);
-    }, 1000);
+    streamSynchronizeActivitiesAPI = streamTaskStatusAPI(
+        taskId,
+        onSuccessGetTaskStatusAPI
+    );
 }
 
 /**
@@ -42,10 +43,11 @@ export function onSuccessSynchronizeActivitiesAPI(taskId) {
  */
 function onSuccessGetTaskStatusAPI(res) {
     if (res.state == "SUCCESS" || res.state == "FAILURE") {
-        clearInterval(intervalSynchronizeActivitiesAPI);
+        // Closed explicitly, as the browser would reconnect to the ended stream
+        streamSynchronizeActivitiesAPI.close();
         unlockButton();
         if (res.state == "SUCCESS") {
-            switch (res.totalActivities) {
+            switch (res.total_activities) {
                 case 0:
                     totalActivities.textContent = "No activity imported";
                     break;
@@ -53,7 +55,7 @@ function onSuccessGetTaskStatusAPI(res) {
                     totalActivities.textContent = "1 activity imported";
                     break;
                 default:
-                    totalActivities.textContent = `${res.totalActivities} activities imported`;
+                    totalActivities.textContent = `${res.total_activities} activities imported`;
                     break;
             }
         }
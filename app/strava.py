@@ -1,31 +1,96 @@
 """Module used to communicate with the Strava API"""
 
 import logging
+import os
 import re
-import time
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from datetime import datetime, timedelta, timezone
-from typing import Optional
+from itertools import islice
+from typing import Iterator, Optional
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 from .assets import User
 from .confs import Conf
 from .postgres import Postgres
+from .rate_limiter import RateLimiter
 
 logger = logging.getLogger(__name__)
 
 
+class RateLimitReached(Exception):
+    """Raised instead of waiting for the API quota, to free the worker.
+    The pause is its only argument so that the result backend can rebuild it"""
+
+    def __init__(self, pause_until: datetime):
+        super().__init__(pause_until)
+        self.pause_until = pause_until
+
+    def __str__(self) -> str:
+        pause_until = self.pause_until.strftime("%d/%m/%Y %H:%M:%S UTC")
+        return f"Waiting for the Strava API quota until {pause_until}"
+
+
 class Strava:
     """Strava class to communicate with the API"""
 
-    def __init__(self, conf: Conf, postgres: Postgres):
+    def __init__(self, conf: Conf, postgres: Postgres, rate_limiter: RateLimiter):
         self.conf = conf
         self.postgres = postgres
-        self.pause_until = None
+        self.rate_limiter = rate_limiter
+        # Shared by the fetching threads to create the session and refresh the token
+        self.lock = threading.RLock()
+        self._session = None
+        self._session_pid = None
+
+    def _create_new_session(self) -> requests.Session:
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=self.conf.STRAVA["session"]["pool_size"],
+            max_retries=Retry(
+                total=self.conf.STRAVA["session"]["retries"],
+                backoff_factor=self.conf.STRAVA["session"]["backoff_factor"],
+                status_forcelist=(500, 502, 503, 504),
+                # The token requests are not retried, an OAuth code is single use
+                allowed_methods=("GET",),
+                raise_on_status=False,
+            ),
+        )
+        session.mount("https://", adapter)
+        session.headers.update({"Accept-Encoding": "gzip, deflate"})
+        return session
+
+    @property
+    def session(self) -> requests.Session:
+        """Returns the HTTP session of the current process, created on first use
+        as the Celery workers are forked after the import"""
+        with self.lock:
+            if self._session_pid != os.getpid():
+                self._session = self._create_new_session()
+                self._session_pid = os.getpid()
+            return self._session
+
+    def get_session_metrics(self) -> dict[str, int]:
+        """Returns the number of requests sent and connections opened by the session"""
+        pools = self.session.get_adapter("https://").poolmanager.pools
+        requests_count = connections_count = 0
+        for key in pools.keys():
+            if pool := pools.get(key):
+                requests_count += pool.num_requests
+                connections_count += pool.num_connections
+        return {
+            "requests": requests_count,
+            "connections": connections_count,
+            "reused_connections": requests_count - connections_count,
+        }
 
     def get_token(self, client_code: str) -> Optional[dict]:
         """Gets the token to connect to the API as the current user"""
-        res = requests.post(
+        res = self.session.post(
             url=self.conf.STRAVA["get_token"]["url"],
             params=self.conf.STRAVA["get_token"]["params"] | {"code": client_code},
             timeout=10,
@@ -40,7 +105,7 @@ class Strava:
 
     def refresh_token(self, refresh_token: str) -> Optional[dict]:
         """Gets the token to connect to the API as the current user"""
-        res = requests.post(
+        res = self.session.post(
             url=self.conf.STRAVA["get_refresh_token"]["url"],
             params=self.conf.STRAVA["get_refresh_token"]["params"]
             | {"refresh_token": refresh_token},
@@ -54,42 +119,62 @@ class Strava:
         logger.warning(f"POST refresh token error : {res.status_code}")
         return None
 
-    def get_activities_ids(self, user: User, page: int = 1) -> list[str]:
+    def get_activities_ids_pages(
+        self, user: User, after: Optional[datetime] = None, page: int = 1
+    ) -> Iterator[tuple[int, list[str]]]:
         """
-        Gets the list of activities from the current user,
-        which may lack of precision according to user preferences
+        Lists the activities from the current user page by page, starting at the
+        given page, and yields each page with its ids. The list may lack of
+        precision according to user preferences.
+        If after is provided, only the activities started after it are listed.
+        Raises requests.HTTPError if a page can't be listed,
+        as the activities missing from a full listing would be deleted
         """
-        self.wait_if_necessary()
-        self.update_bearer_if_necessary(user)
+        params = {}
+        if after:
+            # Naive datetimes are considered as UTC
+            if not after.tzinfo:
+                after = after.replace(tzinfo=timezone.utc)
+            params["after"] = int(after.timestamp())
 
-        res = requests.get(
-            url=self.conf.STRAVA["get_activities"]["url"],
-            params=self.conf.STRAVA["get_activities"]["params"] | {"page": page},
-            headers={"Authorization": f"Bearer {user.strava_access_token}"},
-            timeout=10,
-        )
-        self.is_spamming(res)
+        while True:
+            self.wait_if_necessary(user)
+            self.update_bearer_if_necessary(user)
+
+            res = self.session.get(
+                url=self.conf.STRAVA["get_activities"]["url"],
+                params=self.conf.STRAVA["get_activities"]["params"]
+                | params
+                | {"page": page},
+                headers={"Authorization": f"Bearer {user.strava_access_token}"},
+                timeout=10,
+            )
+            self.is_spamming(res)
+
+            if res.status_code != 200:
+                logger.warning(f"GET list activities error : {res.status_code}")
+                raise requests.HTTPError(
+                    f"GET list activities error : {res.status_code}", response=res
+                )
 
-        if res.status_code == 200:
             data = res.json()
             logger.debug(
                 f"GET list activites : {len(data)} activities found at page {page}"
             )
-            activities = [str(activity["id"]) for activity in data]
-            if len(data) == self.conf.STRAVA["get_activities"]["params"]["per_page"]:
-                activities.extend(self.get_activities_ids(user, page + 1))
-
-            return activities
-
-        logger.warning(f"GET list activities error : {res.status_code}")
-        return {}
+            yield page, [str(activity["id"]) for activity in data]
+            if len(data) < self.conf.STRAVA["get_activities"]["params"]["per_page"]:
+                return
+            page += 1
 
     def get_activity(self, user: User, activity_id: str) -> dict:
-        """Gets a given activity with precise track"""
-        self.wait_if_necessary()
+        """Gets a given activity with precise track,
+        or {} if it does not exist anymore.
+        Raises requests.HTTPError on the other errors, so the activity is not
+        skipped by the synchronization"""
+        self.wait_if_necessary(user)
         self.update_bearer_if_necessary(user)
 
-        res = requests.get(
+        res = self.session.get(
             url=self.conf.STRAVA["get_activity"]["url"].format(id=activity_id),
             headers={"Authorization": f"Bearer {user.strava_access_token}"},
             timeout=10,
@@ -117,8 +202,51 @@ class Strava:
                 "elevation": data["total_elevation_gain"],
             }
 
+        if res.status_code == 404:
+            logger.warning(f"GET activity {activity_id} not found")
+            return {}
+
         logger.warning(f"GET activity {activity_id} error : {res.status_code}")
-        return {}
+        raise requests.HTTPError(
+            f"GET activity {activity_id} error : {res.status_code}", response=res
+        )
+
+    def get_activities(self, user: User, activities_ids: list[str]) -> Iterator[dict]:
+        """
+        Gets the given activities concurrently, at most STRAVA["concurrency"] at once,
+        and yields them as soon as they are fetched.
+        Raises RateLimitReached or requests.HTTPError once the requests already sent
+        are yielded
+        """
+        self.update_bearer_if_necessary(user)
+        concurrency = self.conf.STRAVA["concurrency"]
+        ids = iter(activities_ids)
+
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            # Only a bounded window is submitted so an interrupted generator
+            # does not wait for the whole list to be fetched
+            pending = {
+                executor.submit(self.get_activity, user, activity_id)
+                for activity_id in islice(ids, concurrency)
+            }
+            interrupted = None
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    try:
+                        activity_details = future.result()
+                    except (RateLimitReached, requests.HTTPError) as e:
+                        interrupted = interrupted or e
+                        continue
+                    # Once interrupted, only the requests already sent are yielded
+                    if not interrupted and (activity_id := next(ids, None)) is not None:
+                        pending.add(
+                            executor.submit(self.get_activity, user, activity_id)
+                        )
+                    yield activity_details
+
+            if interrupted:
+                raise interrupted
 
     def is_spamming(self, res: requests.Response):
         """Checks from the headers if the API is spammed"""
@@ -143,61 +271,30 @@ class Strava:
             + f"X-ReadRateLimit [daily] : {used[3]}/{limits[3]} : {round(used_percent[3] * 100, 2)}%"  # pylint: disable=line-too-long
         )
 
-        now = datetime.now(timezone.utc)
-        # Pauses until tomorrow 00:00 UTC
-        if max(used_percent[1], used_percent[3]) > self.conf.STRAVA["spam_limit"]:
-            self.pause_until = (now + timedelta(days=1)).replace(
-                hour=0, minute=0, second=0, microsecond=0
-            )
-
-        # Pauses until next 15 minutes interval
-        elif max(used_percent[0], used_percent[2]) > self.conf.STRAVA["spam_limit"]:
-            next_quarter = (now.minute // 15 + 1) * 15
-            if next_quarter == 60:
-                self.pause_until = (now + timedelta(hours=1)).replace(
-                    minute=0, second=0, microsecond=0
-                )
-            else:
-                self.pause_until = now.replace(
-                    minute=next_quarter, second=0, microsecond=0
-                )
-
-        if self.pause_until:
-            logger.info(
-                "Next API call will be put on hold until "
-                + self.pause_until.strftime("%d/%m/%Y %H:%M:%S UTC"),
-            )
+        self.rate_limiter.record_usage(limits, used)
 
-    def wait_if_necessary(self):
-        """Waits if necessary to prevent to spam the API"""
-        if self.pause_until:
-            if (
-                to_wait := (
-                    self.pause_until - datetime.now(timezone.utc)
-                ).total_seconds()
-            ) > 0:
-                logger.info(
-                    f"Waiting {round(to_wait)} seconds until "
-                    + self.pause_until.strftime("%d/%m/%Y %H:%M:%S UTC")
-                )
-                time.sleep(to_wait)
-        self.pause_until = None
+    def wait_if_necessary(self, user: User):
+        """Raises RateLimitReached if the API calls are put on hold,
+        according to the usage shared by every worker and the share of the user"""
+        if pause_until := self.rate_limiter.reserve(user.email):
+            raise RateLimitReached(pause_until)
 
     def update_bearer_if_necessary(self, user: User):
         """Calls get_token with the refresh_token if the current one has expired"""
-        if user.strava_expires_date < datetime.now():
-            logger.debug("Access token expired")
-            refreshed_token = self.refresh_token(user.strava_refresh_token)
-            user.strava_access_token = refreshed_token["access_token"]
-            user.strava_expires_date = datetime.fromtimestamp(
-                refreshed_token["expires_at"]
-            )
-            user.strava_refresh_token = refreshed_token["refresh_token"]
-            self.postgres.update_user_details(
-                user,
-                {
-                    "strava_access_token": user.strava_access_token,
-                    "strava_expires_date": user.strava_expires_date,
-                    "strava_refresh_token": user.strava_refresh_token,
-                },
-            )
+        with self.lock:
+            if user.strava_expires_date < datetime.now():
+                logger.debug("Access token expired")
+                refreshed_token = self.refresh_token(user.strava_refresh_token)
+                user.strava_access_token = refreshed_token["access_token"]
+                user.strava_expires_date = datetime.fromtimestamp(
+                    refreshed_token["expires_at"]
+                )
+                user.strava_refresh_token = refreshed_token["refresh_token"]
+                self.postgres.update_user_details(
+                    user,
+                    {
+                        "strava_access_token": user.strava_access_token,
+                        "strava_expires_date": user.strava_expires_date,
+                        "strava_refresh_token": user.strava_refresh_token,
+                    },
+                )
@@ -0,0 +1,141 @@
+"""Module used to checkpoint the synchronizations in Redis, shared by the workers"""
+
+import json
+import logging
+from datetime import datetime, timedelta
+from typing import Optional
+
+import redis
+
+from .confs import Conf
+
+logger = logging.getLogger(__name__)
+
+
+class SyncCheckpoint:
+    """Sync Checkpoint class to store the progress of the synchronization of each
+    user, so that a restarted or re-triggered synchronization resumes where it
+    stopped without calling the API again for what is already done.\n
+    Each write also renews the short lease of the synchronization, which expires
+    once its worker is lost, so that it can be triggered again without waiting
+    for the redelivery of its task"""
+
+    def __init__(self, conf: Conf, redis_client: redis.Redis):
+        self.conf = conf
+        self.redis = redis_client
+        self.prefix = self.conf.REDIS["sync_checkpoint_prefix"]
+
+    def get_keys(self, email: str) -> tuple[str, str, str]:
+        """Returns the Redis keys of the state, the listed ids and the completed ids
+        of the synchronization of the user"""
+        key = f"{self.prefix}:{email}"
+        return key, f"{key}:listed", f"{key}:completed"
+
+    def get_lease_key(self, email: str) -> str:
+        """Returns the Redis key of the lease of the synchronization of the user"""
+        return f"{self.prefix}:{email}:lease"
+
+    def renew_lease(
+        self,
+        pipeline: redis.client.Pipeline,
+        email: str,
+        delay: timedelta = timedelta(),
+    ):
+        """Adds to the pipeline the renewal of the lease for the delay and the lease
+        TTL, a longer lease held until a retry being kept"""
+        lease_key = self.get_lease_key(email)
+        ttl = self.conf.SYNC["lease_ttl"] + max(delay, timedelta())
+        pipeline.set(lease_key, 1, ex=ttl, nx=True)
+        pipeline.expire(lease_key, ttl, gt=True)
+
+    def hold(self, email: str, delay: timedelta = timedelta()):
+        """Renews the lease of the synchronization, for the delay until its task is
+        retried if given"""
+        pipeline = self.redis.pipeline()
+        self.renew_lease(pipeline, email, delay)
+        pipeline.execute()
+
+    def is_held(self, email: str) -> bool:
+        """Checks if the lease of the synchronization is held: a worker made
+        progress on it within the lease TTL or its task waits to be retried"""
+        return bool(self.redis.exists(self.get_lease_key(email)))
+
+    def get(self, email: str) -> Optional[dict]:
+        """Returns the checkpoint of the synchronization of the user,
+        or None if no synchronization is in progress:
+        - after : the listing date of the synchronization
+        - page : the next page to list
+        - listed_ids : the ids listed on the previous pages
+        - plan : the plan of list_synchronization once the listing is done
+        - completed_ids : the ids of the activities already imported"""
+        state_key, listed_key, completed_key = self.get_keys(email)
+        pipeline = self.redis.pipeline()
+        pipeline.hgetall(state_key)
+        pipeline.lrange(listed_key, 0, -1)
+        pipeline.smembers(completed_key)
+        state, listed_ids, completed_ids = pipeline.execute()
+        if not state:
+            return None
+
+        return {
+            "after": (
+                datetime.fromtimestamp(float(state[b"after"]))
+                if state[b"after"]
+                else None
+            ),
+            "page": int(state[b"page"]),
+            "listed_ids": [activity_id.decode() for activity_id in listed_ids],
+            "plan": json.loads(state[b"plan"]) if b"plan" in state else None,
+            "completed_ids": {activity_id.decode() for activity_id in completed_ids},
+        }
+
+    def start(self, email: str, after: Optional[datetime]):
+        """Starts a new checkpoint for the synchronization listing after the date"""
+        state_key, listed_key, completed_key = self.get_keys(email)
+        pipeline = self.redis.pipeline()
+        pipeline.delete(state_key, listed_key, completed_key)
+        pipeline.hset(
+            state_key, mapping={"after": after.timestamp() if after else "", "page": 1}
+        )
+        pipeline.expire(state_key, self.conf.SYNC["checkpoint_ttl"])
+        self.renew_lease(pipeline, email)
+        pipeline.execute()
+        logger.debug(f"Synchronization checkpoint of {email} started after {after}")
+
+    def save_page(self, email: str, page: int, activities_ids: list[str]):
+        """Saves the ids listed on the page, the listing resuming at the next one"""
+        state_key, listed_key, _ = self.get_keys(email)
+        pipeline = self.redis.pipeline()
+        if activities_ids:
+            pipeline.rpush(listed_key, *activities_ids)
+        pipeline.hset(state_key, "page", page + 1)
+        pipeline.expire(state_key, self.conf.SYNC["checkpoint_ttl"])
+        pipeline.expire(listed_key, self.conf.SYNC["checkpoint_ttl"])
+        self.renew_lease(pipeline, email)
+        pipeline.execute()
+
+    def save_plan(self, email: str, plan: dict):
+        """Saves the plan once the listing is done, the listed ids being dropped"""
+        state_key, listed_key, _ = self.get_keys(email)
+        pipeline = self.redis.pipeline()
+        pipeline.hset(state_key, "plan", json.dumps(plan))
+        pipeline.delete(listed_key)
+        pipeline.expire(state_key, self.conf.SYNC["checkpoint_ttl"])
+        self.renew_lease(pipeline, email)
+        pipeline.execute()
+
+    def add_completed(self, email: str, activities_ids: list[str]):
+        """Marks the activities as imported, the state expiring with them so that
+        a long import never loses its plan"""
+        state_key, _, completed_key = self.get_keys(email)
+        pipeline = self.redis.pipeline()
+        pipeline.sadd(completed_key, *activities_ids)
+        pipeline.expire(state_key, self.conf.SYNC["checkpoint_ttl"])
+        pipeline.expire(completed_key, self.conf.SYNC["checkpoint_ttl"])
+        self.renew_lease(pipeline, email)
+        pipeline.execute()
+
+    def clear(self, email: str):
+        """Drops the checkpoint once the synchronization is finished"""
+        self.redis.delete(*self.get_keys(email), self.get_lease_key(email))
+        logger.debug(f"Synchronization checkpoint of {email} cleared")
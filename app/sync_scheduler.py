@@ -0,0 +1,146 @@
+"""Module used to schedule the synchronizations fairly between the users"""
+
+import json
+import logging
+import time
+from datetime import datetime
+from typing import Optional
+
+import numpy as np
+import redis
+
+from .confs import Conf
+from .rate_limiter import RateLimiter
+
+logger = logging.getLogger(__name__)
+
+# Separator of the Redis lists of the priorities of a queue, queue:priority
+PRIORITY_SEPARATOR = ":"
+
+
+class SyncScheduler:
+    """Sync Scheduler class to share the workers fairly between the users,
+    the synchronizations and the events being consumed before the chunks of the
+    backfills, and to measure the queues.
+    The Redis broker pops the highest priority of all the queues first, the queue
+    order only breaking the ties, so the chunks take the priorities below the ones
+    of the synchronizations. Each synchronization imports its chunks through a few
+    lanes, each lane going back to the end of the queue after each chunk, so the
+    lanes of every user take turns whatever the number of chunks.
+    The API quota is shared between the users by the RateLimiter"""
+
+    def __init__(
+        self, conf: Conf, redis_client: redis.Redis, rate_limiter: RateLimiter
+    ):
+        self.conf = conf
+        self.redis = redis_client
+        self.rate_limiter = rate_limiter
+        self.prefix = self.conf.REDIS["sync_scheduler_prefix"]
+        self.queues = (
+            self.conf.SCHEDULER["sync_queue"],
+            self.conf.SCHEDULER["backfill_queue"],
+        )
+
+    # ========== PRIORITIES ==========
+
+    def get_transport_options(self) -> dict:
+        """Returns the options of the Redis broker, each queue being split by
+        priority and the tasks being consumed by priority then by queue,
+        for workers started with -Q sync,backfill"""
+        return {
+            "priority_steps": list(range(self.conf.SCHEDULER["priorities"])),
+            "sep": PRIORITY_SEPARATOR,
+            "queue_order_strategy": "priority",
+        }
+
+    def get_sync_priority(self, full_sync: bool) -> int:
+        """Returns the priority of a synchronization, the incremental ones
+        being consumed before the full ones"""
+        return self.conf.SCHEDULER["full_sync_priority"] if full_sync else 0
+
+    def get_chunk_priority(self, first: bool) -> int:
+        """Returns the priority of a chunk, below the priorities of the
+        synchronizations: the first chunks of a synchronization are consumed before
+        the next ones, which are consumed in turns between the lanes of every user
+        as each lane is queued again after each chunk"""
+        return self.conf.SCHEDULER["full_sync_priority"] + (1 if first else 2)
+
+    def get_lanes(self, chunks: list[list[str]]) -> list[list[list[str]]]:
+        """Splits the chunks of a synchronization between its lanes"""
+        lanes = min(self.conf.SCHEDULER["chunk_lanes"], len(chunks))
+        return [chunks[lane::lanes] for lane in range(lanes)]
+
+    # ========== METRICS ==========
+
+    def record_enqueued(self, task_id: str, queue: str, eta: Optional[str] = None):
+        """Records the date from which the task waits in the queue,
+        the end of its countdown if it is delayed"""
+        ready_at = time.time()
+        if eta:
+            ready_at = max(ready_at, datetime.fromisoformat(eta).timestamp())
+        self.redis.set(
+            f"{self.prefix}:enqueued:{task_id}",
+            json.dumps({"queue": queue, "ready_at": ready_at}),
+            ex=self.conf.SCHEDULER["enqueued_ttl"],
+        )
+
+    def record_started(self, task_id: str):
+        """Records the wait time of the task in its queue once started"""
+        key = f"{self.prefix}:enqueued:{task_id}"
+        pipeline = self.redis.pipeline()
+        pipeline.get(key)
+        pipeline.delete(key)
+        if (enqueued := pipeline.execute()[0]) is None:
+            return
+
+        enqueued = json.loads(enqueued)
+        wait_time = max(time.time() - enqueued["ready_at"], 0)
+        wait_times_key = f"{self.prefix}:wait_times:{enqueued['queue']}"
+        pipeline = self.redis.pipeline()
+        pipeline.lpush(wait_times_key, round(wait_time, 3))
+        pipeline.ltrim(wait_times_key, 0, self.conf.SCHEDULER["wait_times_size"] - 1)
+        pipeline.execute()
+        logger.debug(f"Task {task_id} waited {wait_time:.1f}s in {enqueued['queue']}")
+
+    def get_queue_depth(self, queue: str) -> int:
+        """Returns the number of tasks waiting in the queue, whatever their priority,
+        the delayed ones being held by the workers"""
+        pipeline = self.redis.pipeline()
+        pipeline.llen(queue)
+        for priority in range(1, self.conf.SCHEDULER["priorities"]):
+            pipeline.llen(f"{queue}{PRIORITY_SEPARATOR}{priority}")
+        return sum(pipeline.execute())
+
+    def get_wait_times(self, queue: str) -> dict:
+        """Returns the statistics of the latest wait times of the queue, in seconds"""
+        wait_times = np.array(
+            self.redis.lrange(f"{self.prefix}:wait_times:{queue}", 0, -1), dtype=float
+        )
+        if wait_times.size == 0:
+            return {"count": 0, "mean": None, "p50": None, "p95": None, "max": None}
+        return {
+            "count": len(wait_times),
+            "mean": round(float(wait_times.mean()), 3),
+            "p50": round(float(np.percentile(wait_times, 50)), 3),
+            "p95": round(float(np.percentile(wait_times, 95)), 3),
+            "max": float(wait_times.max()),
+        }
+
+    def get_metrics(self) -> dict:
+        """Returns the depth and the wait times of each queue, and the API requests
+        of the users in the current 15 minutes window, without their emails"""
+        users_usages = self.rate_limiter.get_users_usages().values()
+        return {
+            "queues": {
+                queue: {
+                    "depth": self.get_queue_depth(queue),
+                    "wait_times": self.get_wait_times(queue),
+                }
+                for queue in self.queues
+            },
+            "api_usage": {
+                "active_users": len(users_usages),
+                "requests": sum(users_usages),
+                "max_user_requests": max(users_usages, default=0),
+            },
+        }
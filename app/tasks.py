@@ -1,16 +1,233 @@
 """Module used to define the async Celery tasks"""
 
-from datetime import datetime
+import logging
+from datetime import datetime, timedelta, timezone
+
+import requests
+from celery import Task, chord
+from celery.signals import before_task_publish, task_prerun
 
 from .assets import User
-from .setup import activities_manager, celery_app
+from .setup import (
+    CONF,
+    activities_manager,
+    celery_app,
+    progress,
+    sync_checkpoint,
+    sync_scheduler,
+    users_manager,
+)
+from .strava import RateLimitReached
+
+logger = logging.getLogger(__name__)
+
+
+@before_task_publish.connect
+def record_enqueued(headers: dict, routing_key: str, **_kwargs):
+    """Records the date from which each task waits in its queue"""
+    sync_scheduler.record_enqueued(headers["id"], routing_key, headers.get("eta"))
+
+
+@task_prerun.connect
+def record_started(task_id: str, **_kwargs):
+    """Records the wait time of each task once started"""
+    sync_scheduler.record_started(task_id)
+
+
+# The run method is the function of each task using this class as base
+class ProgressTask(Task):  # pylint: disable=abstract-method
+    """Celery task publishing each of its states to the progress streams"""
+
+    def update_state(self, task_id=None, state=None, meta=None, **kwargs):
+        super().update_state(task_id, state, meta, **kwargs)
+        progress.publish(task_id or self.request.id, state, meta)
+
+    def on_success(self, retval, task_id, args, kwargs):
+        progress.publish(task_id, "SUCCESS", retval)
+
+    # pylint: disable-next=too-many-arguments,too-many-positional-arguments
+    def on_retry(self, exc, task_id, args, kwargs, einfo):
+        progress.publish(task_id, "RETRY", str(exc))
+
+    # pylint: disable-next=too-many-arguments,too-many-positional-arguments
+    def on_failure(self, exc, task_id, args, kwargs, einfo):
+        progress.publish(task_id, "FAILURE", str(exc))
+
+
+def report_import_progress(task: Task, root_id: str, total: int):
+    """Counts an activity fetched for the synchronization root_id
+    and reports the combined progress of its chunks on it"""
+    # A chunk redelivered after a crash counts its activities twice
+    current = min(progress.increment(root_id), total)
+    task.update_state(
+        task_id=root_id,
+        state="PROGRESS",
+        meta={
+            "status": f"Importing new activities : {current}/{total}",
+            "current": current,
+            "total": total,
+        },
+    )
+
 
+def get_retry_options(exc: Exception) -> dict:
+    """Returns the options of the retry of a task interrupted by the Strava API,
+    at the end of the pause once the quota is reached,
+    or after a delay and a limited number of times on the other errors"""
+    if isinstance(exc, RateLimitReached):
+        return {"eta": exc.pause_until, "exc": exc}
+    return {
+        "countdown": CONF.SYNC["error_retry_delay"],
+        "max_retries": CONF.SYNC["error_retries"],
+        "exc": exc,
+    }
 
-@celery_app.task(bind=True)
+
+def hold_until_retry(email: str, retry_options: dict):
+    """Holds the lease of the synchronization of the user until its task is retried
+    with the options of get_retry_options, so that it is not triggered again"""
+    sync_checkpoint.hold(
+        email,
+        (
+            retry_options["eta"] - datetime.now(timezone.utc)
+            if "eta" in retry_options
+            else timedelta(seconds=retry_options["countdown"])
+        ),
+    )
+
+
+@celery_app.task(
+    bind=True,
+    base=ProgressTask,
+    max_retries=None,
+    acks_late=True,
+    reject_on_worker_lost=True,
+)
 def synchronize_activities(self, user_details: dict) -> dict:
-    """Synchronizes the activities from the Strava API to the database"""
-    # De-serialize user
-    user_details["strava_expires_date"] = datetime.fromtimestamp(
-        user_details["strava_expires_date"]
+    """Synchronizes the activities from the Strava API to the database.\n
+    The activities to import are listed, then imported by chunks spread across
+    the workers, finish_synchronization aggregating them as the result of this task.
+    A single chunk is imported directly by this task.\n
+    The synchronization is checkpointed, so the task redelivered after a lost
+    worker, rescheduled on an API error or at the end of the pause of the API quota,
+    or triggered again resumes where it stopped"""
+    user = User.from_dict(user_details)
+    after = activities_manager.start_synchronization(user)
+
+    # The activities imported before a retry are not listed anymore
+    progress.reset(self.request.id)
+    try:
+        plan = activities_manager.list_synchronization(user, self, after)
+        to_import = plan.pop("to_import")
+        chunk_size = CONF.SYNC["chunk_size"]
+        if len(to_import) <= chunk_size:
+            activities_manager.import_activities(
+                user,
+                to_import,
+                lambda: report_import_progress(self, self.request.id, len(to_import)),
+            )
+            return activities_manager.finish_synchronization(user, self, plan)
+    except (RateLimitReached, requests.HTTPError) as e:
+        retry_options = get_retry_options(e)
+        hold_until_retry(user.email, retry_options)
+        # The user is serialized again as its token may have been refreshed
+        raise self.retry(args=(user.to_dict(),), **retry_options)
+
+    logger.info(f"Importing {len(to_import)} activity⸱ies of {user.email} by chunks")
+    # The chord takes the id of this task, so its result is the one of the chord.
+    # Each lane takes turns with the lanes of the other users after each chunk,
+    # so a large synchronization does not hold the workers
+    chunks = [
+        to_import[i : i + chunk_size] for i in range(0, len(to_import), chunk_size)
+    ]
+    raise self.replace(
+        chord(
+            [
+                import_activities_chunk.s(
+                    user.email, lane, self.request.id, len(to_import)
+                ).set(priority=sync_scheduler.get_chunk_priority(first=True))
+                for lane in sync_scheduler.get_lanes(chunks)
+            ],
+            finish_synchronization.s(user.email, plan),
+        )
     )
-    return activities_manager.synchronize_activities(User(user_details), self)
+
+
+@celery_app.task(
+    bind=True,
+    base=ProgressTask,
+    max_retries=None,
+    acks_late=True,
+    reject_on_worker_lost=True,
+    queue=CONF.SCHEDULER["backfill_queue"],
+)
+def import_activities_chunk(
+    self, email: str, chunks: list[list[str]], root_id: str, total: int
+):
+    """Imports the first of the chunks of a lane of the synchronization root_id,
+    then replaces itself by the next ones at the end of the queue, so that the lanes
+    of every user take turns.\n
+    The task is acknowledged once done, so the chunk of a lost worker is
+    redelivered to another one. On an API error, or at the end of the pause once
+    the API quota or the share of the user is reached, the task is rescheduled with
+    the activities not imported yet, the synchronization root_id being marked
+    as waiting until the chunk imports again"""
+    user = users_manager.get_user(email)
+    activities_ids, *next_chunks = chunks
+    try:
+        activities_manager.import_activities(
+            user,
+            activities_ids,
+            lambda: report_import_progress(self, root_id, total),
+        )
+    except (RateLimitReached, requests.HTTPError) as e:
+        # The synchronization followed by the user waits with its chunk
+        self.update_state(task_id=root_id, state="RETRY", meta=e)
+        retry_options = get_retry_options(e)
+        hold_until_retry(email, retry_options)
+        raise self.retry(
+            args=(
+                email,
+                [
+                    activities_manager.get_missing_ids(user, activities_ids),
+                    *next_chunks,
+                ],
+                root_id,
+                total,
+            ),
+            **retry_options,
+        )
+
+    # The lane keeps its id, so the chord waits for its last chunk
+    if next_chunks:
+        raise self.replace(
+            import_activities_chunk.s(email, next_chunks, root_id, total).set(
+                priority=sync_scheduler.get_chunk_priority(first=False)
+            )
+        )
+
+
+@celery_app.task(bind=True, base=ProgressTask)
+def finish_synchronization(self, _lanes: list, email: str, plan: dict):
+    """Finishes the synchronization once every lane is imported,
+    its id and its result being the ones of synchronize_activities"""
+    logger.info(f"Chunks of the synchronization of {email} imported")
+    return activities_manager.finish_synchronization(
+        users_manager.get_user(email), self, plan
+    )
+
+
+@celery_app.task(bind=True, max_retries=None)
+def process_activity_event(
+    self, strava_user_id: str, activity_id: str, aspect_type: str, updates: dict
+):
+    """Applies a Strava webhook event on a single activity,
+    rescheduled on an API error or at the end of the pause of the API quota"""
+    if not (user := users_manager.get_user_by_strava_id(strava_user_id)):
+        logger.warning(f"No user for the Strava athlete {strava_user_id}")
+        return
+
+    try:
+        activities_manager.apply_activity_event(user, activity_id, aspect_type, updates)
+    except (RateLimitReached, requests.HTTPError) as e:
+        raise self.retry(**get_retry_options(e))
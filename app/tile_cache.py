@@ -0,0 +1,101 @@
+"""Module used to cache the rendered tiles on disk"""
+
+import hashlib
+import logging
+import os
+import shutil
+import threading
+from typing import Optional
+
+from .assets import User
+from .confs import Conf
+
+logger = logging.getLogger(__name__)
+
+
+def hash_email(email: str) -> str:
+    """Returns a short hash of the email, to name the data of the user publicly"""
+    return hashlib.sha256(email.encode("utf-8")).hexdigest()[:16]
+
+
+class TileCache:
+    """Tile Cache class to store the tiles on disk,
+    the least recently used ones being evicted above the maximum size"""
+
+    def __init__(self, conf: Conf, name: str):
+        self.conf = conf
+        self.folder = os.path.join(self.conf.TILES["cache_folder"], name)
+        self.lock = threading.Lock()
+        self.puts_since_eviction = 0
+
+    # ========== UTILS ==========
+
+    def get_user_folder(self, email: str) -> str:
+        """Returns the folder of the tiles of the user, named after a hash of the email"""
+        return os.path.join(self.folder, hash_email(email))
+
+    def get_path(self, user: User, tile: tuple[int, int, int]) -> str:
+        """Returns the path of the tile of the user, like z/x/y or resolution/q/r,
+        the version of the data being part of it"""
+        return os.path.join(
+            self.get_user_folder(user.email),
+            str(user.data_version),
+            "_".join(map(str, tile)),
+        )
+
+    # ========== CACHE ==========
+
+    def get(self, user: User, tile: tuple[int, int, int]) -> Optional[bytes]:
+        """Returns the cached tile, or None if it is not cached"""
+        path = self.get_path(user, tile)
+        try:
+            with open(path, "rb") as f:
+                tile = f.read()
+            # The modification date is used as the last access date for the eviction
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return tile
+
+    def put(self, user: User, tile: tuple[int, int, int], data: bytes):
+        """Caches the tile, writing it atomically for the concurrent readers"""
+        path = self.get_path(user, tile)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temporary_path, "wb") as f:
+            f.write(data)
+        os.replace(temporary_path, path)
+
+        with self.lock:
+            self.puts_since_eviction += 1
+            if self.puts_since_eviction < self.conf.TILES["eviction_interval"]:
+                return
+            self.puts_since_eviction = 0
+        self.evict()
+
+    def invalidate(self, email: str):
+        """Deletes all the cached tiles of the user"""
+        shutil.rmtree(self.get_user_folder(email), ignore_errors=True)
+        logger.debug(f"Tiles cache {self.folder} invalidated for {email}")
+
+    def evict(self):
+        """Deletes the least recently used tiles until the cache fits its maximum size"""
+        tiles = []
+        for folder, _, files in os.walk(self.folder):
+            for file in files:
+                try:
+                    stat = os.stat(path := os.path.join(folder, file))
+                except FileNotFoundError:
+                    continue
+                tiles.append((stat.st_mtime, stat.st_size, path))
+
+        size = sum(tile[1] for tile in tiles)
+        for _, tile_size, path in sorted(tiles):
+            if size <= self.conf.TILES["max_cache_size"]:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            size -= tile_size
+        logger.debug(f"Tiles cache {self.folder} evicted down to {size} bytes")
@@ -0,0 +1,44 @@
+"""Module used to cache the users in Redis, shared by the web server and the workers"""
+
+import json
+import logging
+from typing import Optional
+
+import redis
+
+from .assets import User
+from .confs import Conf
+
+logger = logging.getLogger(__name__)
+
+
+class UserCache:
+    """User Cache class to avoid querying the database for the user on each request"""
+
+    def __init__(self, conf: Conf, redis_client: redis.Redis):
+        self.conf = conf
+        self.redis = redis_client
+        self.prefix = self.conf.REDIS["user_cache_prefix"]
+
+    def get_key(self, email: str) -> str:
+        """Returns the Redis key of the user"""
+        return f"{self.prefix}:{email}"
+
+    def get(self, email: str) -> Optional[User]:
+        """Returns the cached user, or None if it is not cached"""
+        if (user_dict := self.redis.get(self.get_key(email))) is None:
+            return None
+        return User.from_dict(json.loads(user_dict))
+
+    def set(self, user: User):
+        """Caches the user, until it is invalidated or it expires"""
+        self.redis.set(
+            self.get_key(user.email),
+            json.dumps(user.to_dict()),
+            ex=self.conf.REDIS["user_cache_ttl"],
+        )
+
+    def invalidate(self, email: str):
+        """Drops the cached user, to be called on every update of the user"""
+        self.redis.delete(self.get_key(email))
+        logger.debug(f"User {email} invalidated from the cache")
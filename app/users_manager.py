@@ -7,6 +7,7 @@ import argon2
 
 from .assets import User
 from .postgres import Postgres
+from .user_cache import UserCache
 
 EMAIL_REGEX = r"^\S+@\S+\.[a-zA-Z]{2,}$"
 PASSWORD_REGEX = r"^(?=.*[a-z])(?=.*[A-Z])(?=.*\d)(?=.*[@$!%*?&])[A-Za-z\d@$!%*?&]{8,}$"
@@ -15,13 +16,30 @@ PASSWORD_REGEX = r"^(?=.*[a-z])(?=.*[A-Z])(?=.*\d)(?=.*[@$!%*?&])[A-Za-z\d@$!%*?
 class UsersManager:
     """Users Manager class to create and retrieve the users"""
 
-    def __init__(self, postgres: Postgres, password_hasher: argon2.PasswordHasher):
+    def __init__(
+        self,
+        postgres: Postgres,
+        password_hasher: argon2.PasswordHasher,
+        user_cache: UserCache,
+    ):
         self.postgres = postgres
         self.password_hasher = password_hasher
+        self.user_cache = user_cache
 
     def get_user(self, email: str) -> Optional[User]:
-        """Gets the user associated with the provided email"""
+        """Gets the user associated with the provided email,
+        from the cache if possible as it is loaded on each request"""
+        if user := self.user_cache.get(email):
+            return user
         if user_details := self.postgres.get_user_details(email):
+            user = User(user_details)
+            self.user_cache.set(user)
+            return user
+        return None
+
+    def get_user_by_strava_id(self, strava_user_id: str) -> Optional[User]:
+        """Gets the user associated with the provided Strava athlete id"""
+        if user_details := self.postgres.get_user_details_by_strava_id(strava_user_id):
             return User(user_details)
         return None
 
@@ -44,7 +62,9 @@ class UsersManager:
             and self.verify_if_user_already_exists(user_details["email"])
         ):
             user_details["password"] = self.hash_password(user_details["password"])
-            return self.postgres.save_user(User(user_details))
+            user = User(user_details)
+            self.postgres.save_user(user)
+            return user
         return None
 
     def update_user(self, user: User, details: dict) -> User:
@@ -52,7 +72,7 @@ class UsersManager:
         self.postgres.update_user_details(user, details)
         for attribute, value in details.items():
             setattr(user, attribute, value)
-        return User
+        return user
 
     def verify_email(self, email: str):
         """Verifies if the provided email is valid"""
@@ -0,0 +1,67 @@
+"""Module used to simulate the Strava push subscription against a local server,
+run with python -m app.webhook_simulator"""
+
+import argparse
+import time
+
+import requests
+
+
+def validate_subscription(url: str, verify_token: str) -> bool:
+    """Sends the subscription validation request, as Strava does on creation"""
+    res = requests.get(
+        url,
+        params={
+            "hub.mode": "subscribe",
+            "hub.verify_token": verify_token,
+            "hub.challenge": "challenge",
+        },
+        timeout=2,
+    )
+    return res.status_code == 200 and res.json() == {"hub.challenge": "challenge"}
+
+
+def post_event(
+    url: str,
+    owner_id: int,
+    activity_id: int,
+    aspect_type: str,
+    subscription_id: int,
+) -> int:
+    """Posts an activity event like Strava does, returns the status code"""
+    res = requests.post(
+        url,
+        json={
+            "object_type": "activity",
+            "object_id": activity_id,
+            "aspect_type": aspect_type,
+            "updates": {},
+            "owner_id": owner_id,
+            "subscription_id": subscription_id,
+            "event_time": int(time.time()),
+        },
+        timeout=2,
+    )
+    return res.status_code
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("aspect_type", choices=["create", "update", "delete"])
+    parser.add_argument("owner_id", type=int)
+    parser.add_argument("activity_id", type=int)
+    parser.add_argument("subscription_id", type=int)
+    parser.add_argument("--url", default="http://localhost:5000/strava_webhook")
+    parser.add_argument("--verify-token")
+    args = parser.parse_args()
+
+    if args.verify_token:
+        print(f"Subscription : {validate_subscription(args.url, args.verify_token)}")
+    status_code = post_event(
+        args.url,
+        args.owner_id,
+        args.activity_id,
+        args.aspect_type,
+        args.subscription_id,
+    )
+    print(f"Event : {status_code}")
@@ -0,0 +1,43 @@
+"""Tests of the rasterization of the tracks into heatmap tiles"""
+
+import struct
+import zlib
+
+import numpy as np
+
+from app import heatmap
+
+
+def test_rasterize_counts_each_track_once_per_pixel():
+    """Visits each pixel once per track, even when it goes back and forth"""
+    # The first track goes back and forth on the row 1, the second one crosses it
+    pixels = np.array(
+        [[0.5, 1.5], [3.5, 1.5], [0.5, 1.5], [2.5, 0.5], [2.5, 3.5]], dtype=float
+    )
+    visits = heatmap.rasterize(pixels, np.array([0, 3, 5]), 4)
+
+    assert visits[1].tolist() == [1, 1, 2, 1]
+    assert visits[:, 2].tolist() == [1, 2, 1, 1]
+    assert visits.sum() == 8
+
+
+def test_rasterize_skips_the_segments_outside_the_tile():
+    """Leaves the tile empty when the segments do not cross it"""
+    pixels = np.array([[-10, -10], [-5, -20], [10, 10], [20, 30]], dtype=float)
+    visits = heatmap.rasterize(pixels, np.array([0, 2, 4]), 4)
+
+    assert not visits.any()
+
+
+def test_encode_png():
+    """Encodes a valid grayscale PNG of the image rows"""
+    image = np.arange(12, dtype=np.uint8).reshape(3, 4)
+    png = heatmap.encode_png(image)
+
+    assert png.startswith(b"\x89PNG\r\n\x1a\n")
+    width, height, depth, color_type = struct.unpack(">IIBB", png[16:26])
+    assert (width, height, depth, color_type) == (4, 3, 8, 0)
+    idat = png.index(b"IDAT")
+    (length,) = struct.unpack(">I", png[idat - 4 : idat])
+    rows = zlib.decompress(png[idat + 4 : idat + 4 + length])
+    assert rows == b"".join(b"\x00" + bytes(row) for row in image.tolist())
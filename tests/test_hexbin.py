@@ -0,0 +1,84 @@
+"""Tests of the binning of the tracks into hexagons"""
+
+import numpy as np
+import pytest
+
+from app import hexbin
+
+BASE_SIZE = 100_000
+
+
+def to_batch(tracks: list[list[list[float]]]) -> tuple[np.ndarray, np.ndarray]:
+    """Builds a ragged batch of tracks like polyline.decode_batch"""
+    offsets = np.zeros(len(tracks) + 1, dtype=np.int64)
+    np.cumsum([len(track) for track in tracks], out=offsets[1:])
+    return np.array([point for track in tracks for point in track]), offsets
+
+
+def to_dict(hexbins: dict[str, np.ndarray]) -> dict[tuple[int, int], tuple[int, int]]:
+    """Returns the counts and the visits of each hexagon"""
+    return {
+        (q, r): (counts, visits)
+        for q, r, counts, visits in zip(
+            *(hexbins[column].tolist() for column in ("q", "r", "counts", "visits"))
+        )
+    }
+
+
+def test_bin_tracks_counts_each_track_once_per_hexagon():
+    """Counts every point but visits each hexagon once per track"""
+    size = hexbin.get_hex_size(BASE_SIZE, 10)
+    coords, offsets = to_batch(
+        [
+            [[48.8566, 2.3522], [48.8566, 2.3522], [48.8566, 2.3522]],
+            [[48.8566, 2.3522], [48.8600, 2.3600]],
+        ]
+    )
+    hexbins = to_dict(hexbin.bin_tracks(coords, offsets, size))
+
+    q, r = hexbin.points_to_hexes(hexbin.project(coords[:1]), size)
+    assert hexbins[(q[0], r[0])] == (4, 2)
+    assert sum(counts for counts, _ in hexbins.values()) == len(coords)
+
+
+def test_bin_tracks_distant_tracks():
+    """Bins Paris and Tokyo, far more cells apart than fit in memory"""
+    size = hexbin.get_hex_size(BASE_SIZE, 10)
+    coords, offsets = to_batch(
+        [
+            [[48.8566, 2.3522], [48.8570, 2.3530], [48.8566, 2.3522]],
+            [[35.6762, 139.6503], [35.6770, 139.6510]],
+        ]
+    )
+    hexbins = hexbin.bin_tracks(coords, offsets, size)
+
+    assert hexbins["counts"].sum() == len(coords)
+    assert hexbins["visits"].max() == 1
+    assert set(hexbins) == {"q", "r", "counts", "visits"}
+
+
+def test_bin_tracks_sparse_matches_dense(monkeypatch: pytest.MonkeyPatch):
+    """Bins the same hexagons whether the grid is dense or sparse"""
+    rng = np.random.default_rng(0)
+    coords, offsets = to_batch(
+        [
+            (
+                np.array([45.0, 5.0]) + rng.normal(0, 0.05, (50, 2)).cumsum(axis=0) / 10
+            ).tolist()
+            for _ in range(20)
+        ]
+    )
+    size = hexbin.get_hex_size(BASE_SIZE, 8)
+    dense = to_dict(hexbin.bin_tracks(coords, offsets, size))
+    monkeypatch.setattr(hexbin, "MAX_DENSE_CELLS", 0)
+    sparse = to_dict(hexbin.bin_tracks(coords, offsets, size))
+
+    assert dense == sparse
+
+
+def test_bin_tracks_outside_bbox():
+    """Returns empty columns when no point is in the bbox"""
+    coords, offsets = to_batch([[[48.8566, 2.3522]]])
+    hexbins = hexbin.bin_tracks(coords, offsets, BASE_SIZE, (0, 0, 1, 1))
+
+    assert all(values.size == 0 for values in hexbins.values())
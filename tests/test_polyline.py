@@ -0,0 +1,32 @@
+"""Tests of the vectorized polyline decoding"""
+
+import numpy as np
+
+from app import polyline
+
+# Example of the Google polyline documentation
+POLYLINE = "_p~iF~ps|U_ulLnnqC_mqNvxq`@"
+COORDS = [[38.5, -120.2], [40.7, -120.95], [43.252, -126.453]]
+
+
+def test_decode():
+    """Decodes the example of the Google documentation"""
+    np.testing.assert_allclose(polyline.decode(POLYLINE), COORDS)
+
+
+def test_decode_batch_matches_python():
+    """Decodes a batch with a missing track like the pure Python decoder"""
+    encoded = [POLYLINE, None, polyline.encode(np.array([[1.5, -2.25]]))]
+    coords, offsets = polyline.decode_batch(encoded)
+
+    assert offsets.tolist() == [0, 3, 3, 4]
+    for i, track in enumerate(encoded):
+        np.testing.assert_allclose(
+            coords[offsets[i] : offsets[i + 1]],
+            np.array(polyline.decode_python(track)).reshape(-1, 2),
+        )
+
+
+def test_encode_round_trip():
+    """Encodes back the example of the Google documentation"""
+    assert polyline.encode(np.array(COORDS)) == POLYLINE
@@ -0,0 +1,83 @@
+"""Tests of the sharing of the Strava API quota between the workers and the users"""
+
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import fakeredis
+import pytest
+
+from app import rate_limiter
+
+# The windows of the usage keys must end in the future to be kept by Redis
+NOW = (datetime.now(timezone.utc) + timedelta(days=1)).replace(
+    minute=5, second=0, microsecond=0
+)
+WINDOW_END = NOW.replace(minute=15)
+# 15 minutes and daily limits, 80 requests allowed in a window by the spam limit
+LIMITS = [100, 1000, 100, 1000]
+ALLOWED = 80
+
+
+class FrozenDatetime(datetime):
+    """Datetime frozen at NOW"""
+
+    @classmethod
+    def now(cls, _tz=None):
+        return NOW
+
+
+@pytest.fixture(name="limiter")
+def fixture_limiter(monkeypatch: pytest.MonkeyPatch) -> rate_limiter.RateLimiter:
+    """Rate limiter on a fake Redis, the limits being recorded"""
+    monkeypatch.setattr(rate_limiter, "datetime", FrozenDatetime)
+    conf = SimpleNamespace(
+        REDIS={"rate_limiter_prefix": "rate_limiter"},
+        STRAVA={"spam_limit": 0.8},
+        SCHEDULER={"fair_share_threshold": 0.5},
+    )
+    limiter = rate_limiter.RateLimiter(conf, fakeredis.FakeRedis())
+    limiter.record_usage(LIMITS, [0, 0, 0, 0])
+    return limiter
+
+
+def reserve(limiter: rate_limiter.RateLimiter, count: int, email: str = None):
+    """Reserves the requests and returns the pauses"""
+    return [limiter.reserve(email) for _ in range(count)]
+
+
+def test_reserve_without_limits():
+    """Allows the requests until the limits are read from the API headers"""
+    conf = SimpleNamespace(REDIS={"rate_limiter_prefix": "rate_limiter"})
+    limiter = rate_limiter.RateLimiter(conf, fakeredis.FakeRedis())
+
+    assert limiter.reserve() is None
+
+
+def test_reserve_pauses_past_the_spam_limit(limiter: rate_limiter.RateLimiter):
+    """Puts every worker on hold until the end of the window past the spam limit"""
+    assert reserve(limiter, ALLOWED) == [None] * ALLOWED
+    assert limiter.reserve() == WINDOW_END
+    assert limiter.reserve("alice@example.com") == WINDOW_END
+
+
+def test_reserve_lets_a_single_user_use_the_whole_quota(
+    limiter: rate_limiter.RateLimiter,
+):
+    """Only holds a user alone in the window at the spam limit"""
+    assert reserve(limiter, ALLOWED, "alice@example.com") == [None] * ALLOWED
+    assert limiter.reserve("alice@example.com") == WINDOW_END
+
+
+def test_reserve_holds_a_user_above_its_share(limiter: rate_limiter.RateLimiter):
+    """Holds the user above an equal share past the fair share threshold only"""
+    # Past the 40 requests of the threshold, alone in the window
+    assert reserve(limiter, 41, "alice@example.com") == [None] * 41
+    assert limiter.reserve("bob@example.com") is None
+
+    # alice made 42 of the 43 requests, above half of the 80 allowed
+    assert limiter.reserve("alice@example.com") == WINDOW_END
+    assert limiter.reserve("bob@example.com") is None
+    assert limiter.get_users_usages() == {
+        "alice@example.com": 42,
+        "bob@example.com": 2,
+    }
@@ -0,0 +1,94 @@
+"""Tests of the checkpoints of the synchronizations"""
+
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import fakeredis
+import pytest
+
+from app.sync_checkpoint import SyncCheckpoint
+
+EMAIL = "alice@example.com"
+CHECKPOINT_TTL = timedelta(days=2)
+LEASE_TTL = timedelta(minutes=10)
+
+
+@pytest.fixture(name="checkpoint")
+def fixture_checkpoint() -> SyncCheckpoint:
+    """Sync checkpoint on a fake Redis"""
+    conf = SimpleNamespace(
+        REDIS={"sync_checkpoint_prefix": "sync_checkpoint"},
+        SYNC={"checkpoint_ttl": CHECKPOINT_TTL, "lease_ttl": LEASE_TTL},
+    )
+    return SyncCheckpoint(conf, fakeredis.FakeRedis())
+
+
+def test_get_without_checkpoint(checkpoint: SyncCheckpoint):
+    """Returns None when no synchronization is in progress"""
+    assert checkpoint.get(EMAIL) is None
+
+
+def test_resume_the_listing(checkpoint: SyncCheckpoint):
+    """Resumes the listing after the last page saved"""
+    after = datetime(2026, 1, 1, 12)
+    checkpoint.start(EMAIL, after)
+    checkpoint.save_page(EMAIL, 1, ["1", "2"])
+    checkpoint.save_page(EMAIL, 2, ["3"])
+
+    assert checkpoint.get(EMAIL) == {
+        "after": after,
+        "page": 3,
+        "listed_ids": ["1", "2", "3"],
+        "plan": None,
+        "completed_ids": set(),
+    }
+
+
+def test_resume_the_import(checkpoint: SyncCheckpoint):
+    """Resumes the import of the plan without the completed activities"""
+    plan = {"to_import": ["1", "2", "3"], "to_delete": [], "full_sync": True}
+    checkpoint.start(EMAIL, None)
+    checkpoint.save_page(EMAIL, 1, ["1", "2", "3"])
+    checkpoint.save_plan(EMAIL, plan)
+    checkpoint.add_completed(EMAIL, ["1", "3"])
+
+    assert checkpoint.get(EMAIL) == {
+        "after": None,
+        "page": 2,
+        "listed_ids": [],
+        "plan": plan,
+        "completed_ids": {"1", "3"},
+    }
+
+
+def test_add_completed_refreshes_the_state(checkpoint: SyncCheckpoint):
+    """Keeps the state of a long import alive with its completed activities"""
+    checkpoint.start(EMAIL, None)
+    checkpoint.save_plan(EMAIL, {"to_import": ["1"]})
+    state_key, _, completed_key = checkpoint.get_keys(EMAIL)
+    checkpoint.redis.expire(state_key, 5)
+    checkpoint.add_completed(EMAIL, ["1"])
+
+    assert checkpoint.redis.ttl(state_key) == CHECKPOINT_TTL.total_seconds()
+    assert checkpoint.redis.ttl(completed_key) == CHECKPOINT_TTL.total_seconds()
+
+
+def test_lease(checkpoint: SyncCheckpoint):
+    """Holds the lease while the synchronization progresses or waits for a retry"""
+    lease_key = checkpoint.get_lease_key(EMAIL)
+    assert not checkpoint.is_held(EMAIL)
+    checkpoint.start(EMAIL, None)
+    assert checkpoint.is_held(EMAIL)
+
+    # The lease of a lost worker expires
+    checkpoint.redis.delete(lease_key)
+    assert not checkpoint.is_held(EMAIL)
+
+    # A progress does not shorten the hold until a retry
+    checkpoint.hold(EMAIL, timedelta(hours=1))
+    checkpoint.add_completed(EMAIL, ["1"])
+    assert checkpoint.redis.ttl(lease_key) == 3600 + LEASE_TTL.total_seconds()
+
+    checkpoint.clear(EMAIL)
+    assert not checkpoint.is_held(EMAIL)
+    assert checkpoint.get(EMAIL) is None